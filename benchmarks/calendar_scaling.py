@@ -0,0 +1,81 @@
+"""Scaling benchmark for the calendar feed renderer.
+
+Fills an in-memory SQLite database with one list of N series and a fixed number
+of episodes per series, renders the feed with render_calendar() and prints the
+time per run and per episode. Rendering is linear when the per-episode time
+stays flat while the list grows.
+
+    python -m benchmarks.calendar_scaling
+    python -m benchmarks.calendar_scaling --series 10 100 1000 --episodes 20 --check
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.models import Base, Lists, ListEntries, Series, Episodes
+from src.cal_logic.output import render_calendar
+from src.cal_logic.cache import feed_cache, fragment_cache
+
+def build_database(series_count, episodes_per_series):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Lists), [{"list_id": 1, "list_name": "bench"}])
+        conn.execute(insert(Series), [
+            {"series_id": s, "series_name": f"Show {s}", "series_status": "Running", "series_ext_imdb": f"tt{s:07d}", "series_last_updated": now}
+            for s in range(1, series_count + 1)
+        ])
+        conn.execute(insert(ListEntries), [{"list_id": 1, "series_id": s, "archive": 0} for s in range(1, series_count + 1)])
+        conn.execute(insert(Episodes), [
+            {"ep_series_id": s, "ep_id": s * 10_000 + e, "ep_name": f"Episode {e}", "ep_season": 1, "ep_number": e,
+             "ep_airdate": now + timedelta(days=e - episodes_per_series // 2)}
+            for s in range(1, series_count + 1) for e in range(1, episodes_per_series + 1)
+        ])
+    return engine
+
+def time_render(engine, repeat):
+    best = None
+    with patch("src.cal_logic.output.SessionLocal", sessionmaker(bind=engine)):
+        for _ in range(repeat):
+            # every repeat is a cold render, not a concatenation of cached fragments
+            fragment_cache.clear()
+            feed_cache.clear()
+            start = time.perf_counter()
+            render_calendar((1,))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, nargs="+", default=[10, 50, 250, 1000])
+    parser.add_argument("--episodes", type=int, default=20, help="episodes per series")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check", action="store_true", help="exit 1 when the per-episode time of the largest list is over --max-ratio times the smallest")
+    parser.add_argument("--max-ratio", type=float, default=3.0)
+    args = parser.parse_args(argv)
+
+    print(f"{'series':>8} {'episodes':>10} {'seconds':>10} {'us/episode':>12}")
+    per_episode = []
+    for series_count in args.series:
+        engine = build_database(series_count, args.episodes)
+        seconds = time_render(engine, args.repeat)
+        engine.dispose()
+        episodes = series_count * args.episodes
+        per_episode.append(seconds / episodes)
+        print(f"{series_count:>8} {episodes:>10} {seconds:>10.4f} {seconds / episodes * 1e6:>12.2f}")
+
+    if args.check and per_episode[-1] > per_episode[0] * args.max_ratio:
+        print(f"per-episode render time grew {per_episode[-1] / per_episode[0]:.1f}x (max {args.max_ratio}x)")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Synthetic nousa databases for the benchmarks."""
+import contextlib
+import random
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+
+from src.models import Base, Lists, ListEntries, Series, Episodes, AuditLogEntry
+from src.cal_logic.dates import ics_dates
+from src.services.show_index import create_show_search
+
+# every module that opens sessions with `from src.db import SessionLocal`
+SESSION_MODULES = (
+    "src.cal_logic.output",
+    "src.cal_logic.input",
+    "src.cal_logic.update",
+    "src.cal_logic.export",
+    "src.services.mail",
+)
+
+# every module that opens sessions with `from src.db import AsyncSessionLocal`
+ASYNC_SESSION_MODULES = (
+    "src.cal_logic.input",
+    "src.cal_logic.update",
+    "src.cal_logic.list_ops",
+    "src.routes.web_routes",
+    "src.services.show_index",
+)
+
+def create_database(url="sqlite:///:memory:"):
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        create_show_search(conn)
+    return engine
+
+def fill_database(engine, lists=1, series=100, episodes=20, audit_entries=0, seed=1):
+    """Insert `lists` lists sharing `series` series with `episodes` episodes each.
+
+    Every series is on one list, about a fifth of them on a second list and a
+    tenth of the entries are archived. Episode airdates are spread over the
+    +-365 day window add_episodes keeps.
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(Lists), [{"list_id": l, "list_name": f"list{l}"} for l in range(1, lists + 1)])
+        conn.execute(insert(Series), [
+            {"series_id": s, "series_name": f"Show {s}", "series_status": rng.choice(["Running", "Ended"]),
+             "series_ext_thetvdb": 100_000 + s, "series_ext_imdb": f"tt{s:07d}", "series_last_updated": now}
+            for s in range(1, series + 1)
+        ])
+        entries = {}
+        for s in range(1, series + 1):
+            entries[(rng.randint(1, lists), s)] = int(rng.random() < 0.1)
+            if lists > 1 and rng.random() < 0.2:
+                entries[(rng.randint(1, lists), s)] = 0
+        conn.execute(insert(ListEntries), [{"list_id": l, "series_id": s, "archive": a} for (l, s), a in entries.items()])
+        rows = []
+        for s in range(1, series + 1):
+            for e in range(1, episodes + 1):
+                airdate = now + timedelta(days=rng.randint(-365, 365))
+                ics_start, ics_end = ics_dates(airdate)
+                rows.append({"ep_series_id": s, "ep_id": s * 10_000 + e, "ep_name": f"Episode {e}",
+                             "ep_season": 1 + e // 10, "ep_number": e % 10 + 1, "ep_airdate": airdate,
+                             "ep_ics_start": ics_start, "ep_ics_end": ics_end})
+            if len(rows) >= 10_000:
+                conn.execute(insert(Episodes), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(Episodes), rows)
+        if audit_entries:
+            conn.execute(insert(AuditLogEntry), [
+                {"msg_type_id": 1, "msg_type_name": "series_add", "ip": "127.0.0.1", "list_id": 1,
+                 "series_id": rng.randint(1, series), "series_name": "Show", "created_at": now, "mail_sent": 0}
+                for _ in range(audit_entries)
+            ])
+    return engine
+
+def tvmaze_episodes(series_id, count, start=None):
+    """Episode json shaped like api.tvmaze.com/shows/{id}/episodes."""
+    start = start or datetime.now() - timedelta(days=count // 2)
+    return [
+        {"id": series_id * 10_000 + e, "name": f"Episode {e}", "season": 1 + e // 10, "number": e % 10 + 1,
+         "airdate": (start + timedelta(days=e)).strftime("%Y-%m-%d")}
+        for e in range(1, count + 1)
+    ]
+
+def tvmaze_show(series_id):
+    """Show json shaped like api.tvmaze.com/shows/{id}."""
+    return {"id": series_id, "name": f"Show {series_id}", "status": "Running", "premiered": "2020-01-01",
+            "externals": {"thetvdb": 100_000 + series_id, "imdb": f"tt{series_id:07d}"}, "summary": "<p>summary</p>"}
+
+@contextlib.contextmanager
+def use_database(engine):
+    """Point every SessionLocal and AsyncSessionLocal in the app at `engine`.
+
+    The async sessions open their own aiosqlite connections, so `engine` has to
+    be a file database for both to see the same data. They are not pooled,
+    because TestClient runs every request on a fresh event loop.
+    """
+    factory = sessionmaker(bind=engine)
+    async_engine = create_async_engine(engine.url.set(drivername="sqlite+aiosqlite"), poolclass=NullPool)
+    async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    with contextlib.ExitStack() as stack:
+        for module in SESSION_MODULES:
+            stack.enter_context(patch(f"{module}.SessionLocal", factory))
+        for module in ASYNC_SESSION_MODULES:
+            stack.enter_context(patch(f"{module}.AsyncSessionLocal", async_factory))
+        yield factory
@@ -0,0 +1,158 @@
+"""Benchmark suite for the calendar, list and search hot paths.
+
+Builds a synthetic SQLite database, times the hot paths against it and writes
+the results as JSON. Pass the JSON of an earlier run with --baseline to fail
+(exit 1) when a benchmark got slower than --max-regression times its baseline.
+
+    PYTHONPATH=src python -m benchmarks.run --output bench.json
+    PYTHONPATH=src python -m benchmarks.run --series 2000 --episodes 60 --baseline bench.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import delete, update
+from starlette.testclient import TestClient
+
+from benchmarks.data import create_database, fill_database, use_database, tvmaze_episodes, tvmaze_show
+from src.main import app
+from src.models import Episodes, AuditLogEntry
+from src.cal_logic.cache import feed_cache, fragment_cache
+from src.services.search import search_cache
+from src.cal_logic.input import add_episodes
+from src.cal_logic.update import store_series_update
+from src.services.mail import Mailer
+from tests.conftest import FakeResponse
+
+# stands in for the shared aiohttp.ClientSession so search never leaves the process
+class FakeTVmazeSession:
+    def get(self, url, **kwargs):
+        return FakeResponse(200, [{"score": 1.0 - i / 10, "show": tvmaze_show(i)} for i in range(1, 11)])
+
+def measure(name, func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    result = {
+        "name": name,
+        "repeat": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+    }
+    print(f"{name:<32} median {result['median'] * 1000:>10.3f} ms   min {result['min'] * 1000:>10.3f} ms")
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def clear_caches():
+    feed_cache.clear()
+    fragment_cache.clear()
+    search_cache.clear()
+
+def run_benchmarks(args, engine, factory):
+    client = TestClient(app)
+    results = []
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+
+    results.append(measure("download_calendar (cold)", lambda: get("/subscribe/1"), args.repeat, setup=clear_caches))
+    get("/subscribe/1")
+    results.append(measure("download_calendar (cached)", lambda: get("/subscribe/1"), args.repeat))
+    results.append(measure("download_calendar (merge, cold)", lambda: get(f"/subscribe/merge?lists={','.join(str(l) for l in range(1, args.lists + 1))}"), args.repeat, setup=clear_caches))
+    results.append(measure("list_page", lambda: get("/list/1"), args.repeat))
+
+    with patch("src.services.tvmaze.get_session", FakeTVmazeSession):
+        results.append(measure("search (cold)", lambda: get("/search?q=show"), args.repeat, setup=clear_caches))
+        results.append(measure("search (cached)", lambda: get("/search?q=show"), args.repeat))
+    results.append(measure("autocomplete", lambda: get("/autocomplete?q=show 1"), args.repeat))
+
+    new_series_id = args.series + 1
+    edata = tvmaze_episodes(new_series_id, args.episodes)
+
+    def remove_new_episodes():
+        with factory() as session:
+            session.execute(delete(Episodes).where(Episodes.ep_series_id == new_series_id))
+            session.commit()
+
+    results.append(measure("add_episodes", lambda: add_episodes(new_series_id, edata), args.repeat, setup=remove_new_episodes))
+
+    sdata, edata = tvmaze_show(1), tvmaze_episodes(1, args.episodes)
+    results.append(measure("store_series_update", lambda: store_series_update(1, sdata, edata), args.repeat))
+
+    def reset_mail_sent():
+        with factory() as session:
+            session.execute(update(AuditLogEntry).values(mail_sent=0))
+            session.commit()
+
+    mailer = Mailer(body="benchmark")
+    results.append(measure("create_weekly_notification_email", mailer.create_weekly_notification_email, args.repeat, setup=reset_mail_sent))
+    return results
+
+def compare(results, baseline_path, max_regression):
+    baseline = {result["name"]: result for result in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous and result["median"] > previous["median"] * max_regression:
+            regressions.append(f"{result['name']}: {previous['median'] * 1000:.3f} ms -> {result['median'] * 1000:.3f} ms")
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return not regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lists", type=int, default=3)
+    parser.add_argument("--series", type=int, default=300)
+    parser.add_argument("--episodes", type=int, default=40, help="episodes per series")
+    parser.add_argument("--audit", type=int, default=5000, help="audit log entries")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as json to this file")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a file database, so sqlite does real i/o like in production
+        engine = create_database(f"sqlite:///{tmp}/bench.db")
+        fill_database(engine, lists=args.lists, series=args.series, episodes=args.episodes, audit_entries=args.audit)
+        with use_database(engine) as factory, patch("src.cal_logic.cache.FEED_EXPORT_DIR", Path(tmp) / "feeds"):
+            results = run_benchmarks(args, engine, factory)
+        engine.dispose()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "params": {"lists": args.lists, "series": args.series, "episodes": args.episodes, "audit": args.audit, "repeat": args.repeat},
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
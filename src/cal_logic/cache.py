@@ -0,0 +1,273 @@
+from email.utils import formatdate, parsedate_to_datetime
+from datetime import datetime, timezone
+from collections import OrderedDict
+from pathlib import Path
+from sqlalchemy import select
+import brotli
+import gzip
+import hashlib
+import logging
+import os
+import threading
+
+from src.models import ListEntries
+
+logger = logging.getLogger(__name__)
+
+# http dates have second precision
+def feed_timestamp():
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+def format_http_date(timestamp):
+    return formatdate(timestamp.timestamp(), usegmt=True)
+
+# compression of cached and exported feeds
+FEED_BROTLI_QUALITY = int(os.getenv("FEED_BROTLI_QUALITY", "9"))
+FEED_GZIP_LEVEL = int(os.getenv("FEED_GZIP_LEVEL", "9"))
+
+# content codings a cached feed can be sent in, in order of preference. gzip mtime=0 keeps the output stable
+FEED_ENCODINGS = {
+    "br": lambda body: brotli.compress(body, quality=FEED_BROTLI_QUALITY, mode=brotli.MODE_TEXT),
+    "gzip": lambda body: gzip.compress(body, compresslevel=FEED_GZIP_LEVEL, mtime=0),
+}
+
+# pick a content coding from an Accept-Encoding header. returns "identity" when the client accepts none of FEED_ENCODINGS
+def choose_encoding(accept_encoding):
+    if not accept_encoding:
+        return "identity"
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = "identity", 0.0
+    for coding in FEED_ENCODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+# strong etag of a feed body from a sha256 of it. exported files and feed_cache entries use the same etag,
+# so a client does not have to download the same feed again when it moves between them
+def content_etag(digest):
+    return f'"{digest.hexdigest()[:32]}"'
+
+# every representation of a feed needs its own strong etag
+def representation_etag(etag, encoding):
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+# a rendered calendar feed plus the validators sent to calendar clients.
+# compressed variants are produced once per feed version, on first request, and kept with the entry.
+# size counts the body and every variant, on_grow(added_bytes) is called when a variant is added
+class FeedEntry:
+    def __init__(self, body: bytes, last_modified=None, on_grow=None):
+        self.body = body
+        self.etag = content_etag(hashlib.sha256(body))
+        self.last_modified = last_modified or feed_timestamp()
+        self.size = len(body)
+        self._on_grow = on_grow
+        self._encoded = {"identity": body}
+        self._lock = threading.Lock()
+
+    @property
+    def last_modified_http(self):
+        return format_http_date(self.last_modified)
+
+    def encoded(self, encoding):
+        with self._lock:
+            if encoding in self._encoded:
+                return self._encoded[encoding]
+            encoded = self._encoded[encoding] = FEED_ENCODINGS[encoding](self.body)
+            self.size += len(encoded)
+        if self._on_grow is not None:
+            self._on_grow(len(encoded))
+        return encoded
+
+    def etag_for(self, encoding):
+        return representation_etag(self.etag, encoding)
+
+    def is_not_modified(self, request_headers, encoding="identity"):
+        return is_not_modified(request_headers, self.etag_for(encoding), self.last_modified)
+
+def is_not_modified(request_headers, etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified <= since
+    return False
+
+# exported feeds on disk: {list_id}.ics plus one file per FEED_ENCODINGS coding, e.g. 1.ics.gz,
+# and {list_id}.ics.etag with the content_etag of the feed
+FEED_EXPORT_DIR = Path(os.getenv("FEED_EXPORT_DIR", "data/feeds"))
+FEED_FILE_SUFFIXES = {"identity": "", "br": ".br", "gzip": ".gz"}
+
+def feed_path(list_id, encoding="identity"):
+    return FEED_EXPORT_DIR / f"{list_id}.ics{FEED_FILE_SUFFIXES[encoding]}"
+
+def feed_etag_path(list_id):
+    return FEED_EXPORT_DIR / f"{list_id}.ics.etag"
+
+# content_etag of an exported feed, None when the list has not been exported
+def read_feed_etag(list_id):
+    try:
+        return feed_etag_path(list_id).read_text()
+    except FileNotFoundError:
+        return None
+
+# cache of rendered calendar feeds. a feed is keyed by (list_ids, window start, window end), so every
+# merge of lists is cached separately. write paths call invalidate(list_id), which drops all feeds containing
+# that list so the next poll re-renders. the least recently used feeds are evicted past max_entries or once
+# the bodies and their compressed variants take more than max_bytes
+class FeedCache:
+    def __init__(self, max_entries=int(os.getenv("FEED_CACHE_MAX_ENTRIES", "256")), max_bytes=int(os.getenv("FEED_CACHE_MAX_TOTAL_BYTES", str(64 * 1024 * 1024)))):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def generation(self, list_ids):
+        # take this before rendering and hand it to store(), so a render that raced an invalidate is not cached
+        with self._lock:
+            return self._generation(list_ids)
+
+    # generation of the feed of one list, for export_feed and publish_files
+    def generation_for_list(self, list_id):
+        return self.generation((list_id,))
+
+    def _generation(self, list_ids):
+        return (self._epoch, tuple(self._generations.get(list_id, 0) for list_id in list_ids))
+
+    def store(self, key, body: bytes, generation, last_modified=None):
+        entry = FeedEntry(body, last_modified, on_grow=lambda added: self._grown(key, entry, added))
+        with self._lock:
+            if self._generation(key[0]) == generation:
+                self._remove(key)
+                self._entries[key] = entry
+                self._bytes += entry.size
+                self._evict()
+        return entry
+
+    # a compressed variant was added to entry. entries that were evicted meanwhile are no longer counted
+    def _grown(self, key, entry, added):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._bytes += added
+                self._evict()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+    def publish_files(self, list_id, generation, temp_paths, temp_etag_path):
+        # move freshly exported files into place, unless the list was invalidated while they were written.
+        # the etag goes last, so a reader never gets the etag of a feed it was not sent
+        with self._lock:
+            if self._generation((list_id,)) == generation:
+                for encoding, temp_path in temp_paths.items():
+                    os.replace(temp_path, feed_path(list_id, encoding))
+                os.replace(temp_etag_path, feed_etag_path(list_id))
+                return True
+        for temp_path in [*temp_paths.values(), temp_etag_path]:
+            Path(temp_path).unlink(missing_ok=True)
+        return False
+
+    def invalidate(self, list_id):
+        with self._lock:
+            for key in [key for key in self._entries if list_id in key[0]]:
+                self._remove(key)
+            self._generations[list_id] = self._generations.get(list_id, 0) + 1
+        # file i/o outside the lock. an export of the new generation published in between is removed
+        # as well, the feed is then rendered live until the next export
+        for path in [feed_etag_path(list_id), *(feed_path(list_id, encoding) for encoding in FEED_FILE_SUFFIXES)]:
+            path.unlink(missing_ok=True)
+        logger.debug(f"Calendar feed cache invalidated for list {list_id}")
+
+    def invalidate_series(self, session, series_id):
+        list_ids = session.execute(select(ListEntries.list_id).where(ListEntries.series_id == series_id)).scalars().all()
+        for list_id in list_ids:
+            self.invalidate(list_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._epoch += 1
+
+# cache of rendered VEVENT blocks, keyed by ep_id plus the series_last_updated of its show. a feed rebuild
+# only renders episodes that changed and concatenates the rest. store_series_update and del_series evict a series
+class FragmentCache:
+    def __init__(self, max_entries=int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "200000"))):
+        self.max_entries = max_entries
+        self._series = OrderedDict() # series_id -> {ep_id: (series_last_updated, fragment)}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, series_id, ep_id, series_last_updated):
+        with self._lock:
+            cached = self._series.get(series_id, {}).get(ep_id)
+        if cached is not None and cached[0] == series_last_updated:
+            return cached[1]
+        return None
+
+    def put(self, series_id, ep_id, series_last_updated, fragment: bytes):
+        with self._lock:
+            episodes = self._series.setdefault(series_id, {})
+            if ep_id not in episodes:
+                self._size += 1
+            episodes[ep_id] = (series_last_updated, fragment)
+            # evict whole series, least recently filled first
+            while self._size > self.max_entries and len(self._series) > 1:
+                _, evicted = self._series.popitem(last=False)
+                self._size -= len(evicted)
+
+    def evict_series(self, series_id):
+        with self._lock:
+            evicted = self._series.pop(series_id, {})
+            self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._size = 0
+
+feed_cache = FeedCache()
+fragment_cache = FragmentCache()
@@ -0,0 +1,11 @@
+from datetime import timedelta
+
+# episodes are stored for this many days before and after today, see episode_rows
+STORED_EPISODE_DAYS = 365
+
+# DTSTART and DTEND date keys of the event of an episode. add_episodes stores them with the episode,
+# render_event falls back to them for rows stored without
+def ics_dates(airdate):
+    ep_start = airdate + timedelta(days=1) # add one day for proper calendar event start date
+    ep_end = airdate + timedelta(days=2) # add two days for event end
+    return f"{ep_start:%Y%m%d}", f"{ep_end:%Y%m%d}"
@@ -0,0 +1,86 @@
+from sqlalchemy import select
+import brotli
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+
+from src.models import Lists, ListEntries
+from src.db import SessionLocal
+from src.cal_logic.cache import feed_cache, feed_path, content_etag, FEED_FILE_SUFFIXES, FEED_BROTLI_QUALITY, FEED_GZIP_LEVEL
+from src.cal_logic.output import iter_calendar
+
+logger = logging.getLogger(__name__)
+
+# streaming compressors matching FEED_ENCODINGS in cache.py
+class _GzipWriter:
+    def __init__(self):
+        self._compressor = zlib.compressobj(FEED_GZIP_LEVEL, zlib.DEFLATED, 31) # wbits 31 writes a gzip container
+    def process(self, chunk):
+        return self._compressor.compress(chunk)
+    def finish(self):
+        return self._compressor.flush()
+
+class _BrotliWriter:
+    def __init__(self):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=FEED_BROTLI_QUALITY)
+    def process(self, chunk):
+        return self._compressor.process(chunk)
+    def finish(self):
+        return self._compressor.finish()
+
+_WRITERS = {"identity": None, "br": _BrotliWriter, "gzip": _GzipWriter}
+
+# write the default window feed of a list to FEED_EXPORT_DIR, uncompressed and in every coding.
+# files are written to temp files next to the target and renamed into place, so readers never see a partial feed
+def export_feed(list_id):
+    export_dir = feed_path(list_id).parent
+    export_dir.mkdir(parents=True, exist_ok=True)
+    generation = feed_cache.generation_for_list(list_id)
+    files = {}
+    writers = {}
+    digest = hashlib.sha256()
+    try:
+        for encoding in FEED_FILE_SUFFIXES:
+            files[encoding] = tempfile.NamedTemporaryFile(dir=export_dir, prefix=f".{list_id}.", suffix=".tmp", delete=False)
+            writers[encoding] = _WRITERS[encoding]() if _WRITERS[encoding] else None
+        size = 0
+        for chunk in iter_calendar((list_id,)):
+            size += len(chunk)
+            digest.update(chunk)
+            for encoding, file in files.items():
+                file.write(writers[encoding].process(chunk) if writers[encoding] else chunk)
+        for encoding, file in files.items():
+            if writers[encoding]:
+                file.write(writers[encoding].finish())
+            file.flush()
+            os.fsync(file.fileno())
+            file.close()
+        with tempfile.NamedTemporaryFile("w", dir=export_dir, prefix=f".{list_id}.", suffix=".tmp", delete=False) as etag_file:
+            etag_file.write(content_etag(digest))
+    except Exception:
+        for file in files.values():
+            file.close()
+            os.unlink(file.name)
+        raise
+
+    if feed_cache.publish_files(list_id, generation, {encoding: file.name for encoding, file in files.items()}, etag_file.name):
+        logger.info(f"Calendar feed of list {list_id} exported ({size} bytes)")
+    else:
+        logger.info(f"Calendar feed of list {list_id} changed during export, export discarded")
+
+def export_series_feeds(series_id):
+    with SessionLocal() as session:
+        list_ids = session.execute(select(ListEntries.list_id).where(ListEntries.series_id == series_id)).scalars().all()
+    for list_id in list_ids:
+        export_feed(list_id)
+
+def export_all_feeds():
+    with SessionLocal() as session:
+        list_ids = session.execute(select(Lists.list_id)).scalars().all()
+    for list_id in list_ids:
+        try:
+            export_feed(list_id)
+        except Exception as err:
+            logger.error(f"Calendar feed export of list {list_id} failed: {err}")
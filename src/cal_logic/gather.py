@@ -1,88 +1,101 @@
 import aiohttp
-import requests
+import asyncio
 import logging
+import os
+import random
 import time
 from datetime import datetime, timedelta
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.jobstores.base import ConflictingIdError
 
 from src.scheduler import scheduler
-from src.cal_logic.update import series_update
+from src.services.tvmaze import tvmaze
+from src.cal_logic.update import series_update_async
 
 logger = logging.getLogger(__name__)
 
-# asynchronous api calls used in add_to_database()
+# retries of a tvmaze fetch in the scheduled refresh: exponential backoff with full jitter, within a deadline.
+# when the deadline passes the refresh is handed back to the scheduler for TVMAZE_RETRY_LATER_HOURS
+TVMAZE_RETRY_BASE_DELAY = float(os.getenv("TVMAZE_RETRY_BASE_DELAY", "2")) # seconds
+TVMAZE_RETRY_MAX_DELAY = float(os.getenv("TVMAZE_RETRY_MAX_DELAY", "60")) # seconds
+TVMAZE_RETRY_DEADLINE = float(os.getenv("TVMAZE_RETRY_DEADLINE", "300")) # seconds per fetch, all attempts together
+TVMAZE_RETRY_LATER_HOURS = float(os.getenv("TVMAZE_RETRY_LATER_HOURS", "24"))
+# fetch a show and its episodes in one request with /shows/{id}?embed=episodes, instead of two
+TVMAZE_EMBED_EPISODES = os.getenv("TVMAZE_EMBED_EPISODES", "true").lower() == "true"
+
+# (show, episodes) of a /shows/{id}?embed=episodes response
+def split_embedded(data):
+    if data is None:
+        return None, None
+    return data, data.get("_embedded", {}).get("episodes")
+
+# asynchronous api calls used in add_to_database(), through the rate limited tvmaze client
+# show and episode responses are cached on disk and revalidated with conditional requests
 async def fetch_data(url):
-    async with aiohttp.ClientSession() as aiosession:
-	    async with aiosession.get(url) as aioresponse:
-                return await aioresponse.json()
+    return await tvmaze.get(url, cache=True)
 
-# scheduler runs a weekly cronjob; 'series_update'
-# the function 'series_update' runs 'try_request_series'
-# the function 'try_request_series' runs 'request_series', and retries if it fails
-# After a successful run all TV show data has been refreshed
-def request_series(series_id):
-    try:
-        response_series = requests.get(f"https://api.tvmaze.com/shows/{series_id}", timeout=10)
-        response_series.raise_for_status()
-        return response_series.json()
-    except:
-        return None
+# (json, not_modified) of url, retried with backoff until it succeeds or the deadline passes.
+# returns (None, False) on failure. client errors (a 404 for a deleted show) will not go away
+# by retrying, so they are raised right away as aiohttp.ClientResponseError; 429 is retried
+async def fetch_with_backoff(url, deadline=TVMAZE_RETRY_DEADLINE):
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        try:
+            return await tvmaze.get_cached(url, cache=True)
+        except aiohttp.ClientResponseError as err:
+            if 400 <= err.status < 500 and err.status != 429:
+                raise
+            logger.warning(f"{url} attempt {attempt + 1} failed: {err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.warning(f"{url} attempt {attempt + 1} failed: {err}")
+        delay = random.uniform(0, min(TVMAZE_RETRY_MAX_DELAY, TVMAZE_RETRY_BASE_DELAY * 2 ** attempt))
+        if time.monotonic() + delay > give_up_at:
+            return None, False
+        await asyncio.sleep(delay)
+        attempt += 1
 
-def try_request_series(series_id, max_retries=30, delay=60): # try a request every minute for half an hour, if all fail then schedule new job in 24h
-    retries = 0
-    while retries < max_retries:
-        result = request_series(series_id)
-        if result is not None:
-            return result
-        retries += 1
-        logger.error(f'series_update series retry {retries}')
-        time.sleep(delay)
-    try: # check if job already exists in order to avoid conflict when adding job to db
-        existing_job = scheduler.get_job(job_id=f'series_update_retry_request_series_{series_id}')
-        if existing_job:
-            logger.info("series_update_retry_request_series job already exists. not adding new job.")
-        else:
-            scheduler.add_job(
-                func=series_update,
-                args=[series_id],
-                trigger=DateTrigger(run_date=datetime.now() + timedelta(hours=24)),
-                id=f'series_update_retry_request_series_{series_id}',
-                coalesce=True
-            )
-    except ConflictingIdError as err:
-        logger.error(err)
-    return None
+async def fetch_series(series_id):
+    return await fetch_with_backoff(f"https://api.tvmaze.com/shows/{series_id}")
+
+async def fetch_episodes(series_id):
+    return await fetch_with_backoff(f"https://api.tvmaze.com/shows/{series_id}/episodes")
+
+# (show, episodes) of a series for add_to_series
+async def fetch_show_and_episodes(series_id):
+    if TVMAZE_EMBED_EPISODES:
+        return split_embedded(await fetch_data(f"https://api.tvmaze.com/shows/{series_id}?embed=episodes"))
+    return await asyncio.gather(
+        fetch_data(f"https://api.tvmaze.com/shows/{series_id}"),
+        fetch_data(f"https://api.tvmaze.com/shows/{series_id}/episodes")
+    )
 
-def request_episodes(series_id):
-    try:
-        response_episodes = requests.get(f"https://api.tvmaze.com/shows/{series_id}/episodes", timeout=10)
-        response_episodes.raise_for_status()
-        return response_episodes.json()
-    except:
-        return None
+# (show, episodes, not_modified) of a series for series_update_async, show and episodes are None on failure.
+# raises aiohttp.ClientResponseError when tvmaze answers with a client error, see fetch_with_backoff
+async def fetch_series_update_data(series_id):
+    if TVMAZE_EMBED_EPISODES:
+        data, not_modified = await fetch_with_backoff(f"https://api.tvmaze.com/shows/{series_id}?embed=episodes")
+        return *split_embedded(data), not_modified
+    (sdata, series_not_modified), (edata, episodes_not_modified) = await asyncio.gather(fetch_series(series_id), fetch_episodes(series_id))
+    return sdata, edata, series_not_modified and episodes_not_modified
 
-def try_request_episodes(series_id, max_retries=30, delay=60): # try a request every minute for half an hour, if all fail then schedule new job in 24h
-    retries = 0
-    while retries < max_retries:
-        result = request_episodes(series_id)
-        if result is not None:
-            return result
-        retries += 1
-        logger.error(f'series_update episodes retry {retries}')
-        time.sleep(delay)
+# run the refresh of a series again later, instead of waiting for tvmaze in a worker
+def schedule_series_retry(series_id):
+    job_id = f'series_update_retry_{series_id}'
     try: # check if job already exists in order to avoid conflict when adding job to db
-        existing_job = scheduler.get_job(job_id=f'series_update_retry_request_episodes_{series_id}')
-        if existing_job:
-            logger.info("series_update_retry_request_series job already exists. not adding new job.")
-        else:
-            scheduler.add_job(
-                func=series_update,
-                args=[series_id],
-                trigger=DateTrigger(run_date=datetime.now() + timedelta(hours=24)),
-                id=f'series_update_retry_request_episodes_{series_id}',
-                coalesce=True
-            )
+        if scheduler.get_job(job_id=job_id):
+            logger.info(f"{job_id} job already exists. not adding new job.")
+            return
+        scheduler.add_job(
+            func=series_update_async,
+            args=[series_id],
+            trigger=DateTrigger(run_date=datetime.now() + timedelta(hours=TVMAZE_RETRY_LATER_HOURS)),
+            id=job_id,
+            name=job_id,
+            misfire_grace_time=518400, # 6 days
+            coalesce=True,
+            jobstore='single_show_updates'
+        )
+        logger.info(f"series_update of {series_id} failed, retrying in {TVMAZE_RETRY_LATER_HOURS} hours")
     except ConflictingIdError as err:
         logger.error(err)
-    return None
\ No newline at end of file
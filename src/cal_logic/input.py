@@ -1,39 +1,58 @@
 from datetime import datetime, timedelta
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
-from starlette.background import BackgroundTask
-from sqlalchemy import select, update
+from starlette.background import BackgroundTask, BackgroundTasks
+from sqlalchemy import select, update, insert
 from sqlalchemy.exc import PendingRollbackError
-import asyncio
 import logging
 from collections import defaultdict
 
 from src.services.templates import templates
 from src.models import Episodes, Series, ListEntries, AuditLogEntry
-from src.db import SessionLocal
+from src.db import SessionLocal, AsyncSessionLocal
 from src.routes.template_data import popular_tv_shows
-from src.cal_logic.gather import fetch_data
+from src.cal_logic.gather import fetch_show_and_episodes
+from src.cal_logic.cache import feed_cache
+from src.cal_logic.export import export_feed
+from src.cal_logic.dates import ics_dates, STORED_EPISODE_DAYS
 
 logger = logging.getLogger(__name__)
 
-# add episode data to Episodes table in db
-def add_episodes(series_id, edata):
+# rows for the Episodes table from tvmaze episode data
+# filter episodes so only episodes between one year ago and one year into the future get into the calendar
+def episode_rows(series_id, edata):
+    now = datetime.now()
+    one_year_ago = now - timedelta(days=STORED_EPISODE_DAYS)
+    one_year_future = now + timedelta(days=STORED_EPISODE_DAYS)
+    rows = []
     for episode in edata:
-        ep_id = episode.get("id")
-        ep_name = episode.get("name")
-        ep_season = episode.get("season")
-        ep_number = episode.get("number")
         ep_airdate_str = episode.get("airdate")
+        if not ep_airdate_str: # tvmaze sends an empty airdate for episodes that have not been scheduled yet
+            continue
         ep_airdate = datetime.strptime(ep_airdate_str, "%Y-%m-%d")
-        # filter episodes so only episodes between one year ago and one year into the future get into the calendar
-        one_year_ago = datetime.now() - timedelta(days=365)
-        one_year_future = datetime.now() + timedelta(days=365)
         if ep_airdate >= one_year_ago and ep_airdate <= one_year_future:
-            
-            episodes = Episodes(ep_series_id=int(series_id), ep_id=ep_id, ep_name=ep_name, ep_season=ep_season, ep_number=ep_number, ep_airdate=ep_airdate)
-            with SessionLocal() as session:
-                session.add(episodes)
-                session.commit()
+            ep_ics_start, ep_ics_end = ics_dates(ep_airdate)
+            rows.append({
+                "ep_series_id": int(series_id),
+                "ep_id": episode.get("id"),
+                "ep_name": episode.get("name"),
+                "ep_season": episode.get("season"),
+                "ep_number": episode.get("number"),
+                "ep_airdate": ep_airdate,
+                "ep_ics_start": ep_ics_start,
+                "ep_ics_end": ep_ics_end,
+            })
+    return rows
+
+# add episode data to Episodes table in db with one multi-row insert in one transaction
+def add_episodes(series_id, edata):
+    rows = episode_rows(series_id, edata)
+    with SessionLocal() as session:
+        if rows:
+            session.execute(insert(Episodes), rows)
+            session.commit()
+        feed_cache.invalidate_series(session, series_id)
+    return len(rows)
 
 # add TV show to ListEntries table and Series table
 async def add_to_series(request: Request):
@@ -48,44 +67,53 @@ async def add_to_series(request: Request):
     except:
         message = "Error: Invalid input. Try again, but no tricks this time ;)"
         return templates.TemplateResponse(request, "index.html", {"message": message, "popular_tv_shows": popular_tv_shows})
-    with SessionLocal() as session:
+    async with AsyncSessionLocal() as session:
         try:
-            series_exist = session.get(Series, series_id)
+            series_exist = await session.get(Series, series_id)
             
-            le_exist = session.scalars(select(ListEntries).where(
+            le_exist = (await session.scalars(select(ListEntries).where(
                     ListEntries.list_id == int(list_id),
                     ListEntries.series_id == int(series_id)
                 )
-            ).first()
+            )).first()
 
-            le_exist_archive = session.scalars(select(ListEntries).where(
+            le_exist_archive = (await session.scalars(select(ListEntries).where(
                     ListEntries.list_id == int(list_id),
                     ListEntries.series_id == int(series_id),
                     ListEntries.archive == 1
                 )
-            ).first()
+            )).first()
 
             # ListEntries logic
             if le_exist is not None:
                 if le_exist_archive is not None:
                     
-                    session.execute(update(ListEntries).where(
+                    await session.execute(update(ListEntries).where(
                         ListEntries.list_id == int(list_id),
                         ListEntries.series_id == int(series_id)
                     )
                     .values(archive=0)
                     .execution_options(synchronize_session="fetch"))
                     
-                    session.commit()
+                    await session.commit()
+                    feed_cache.invalidate(list_id)
                     message = f"{series_exist.series_name} has been moved to main"
-                else:
-                    message = f"{series_name} is already in list {list_id}"
+                    redirect_url = f"/list/{list_id}"
+                    return RedirectResponse(url=redirect_url, background=BackgroundTask(export_feed, list_id))
+                message = f"{series_name} is already in list {list_id}"
                 redirect_url = f"/list/{list_id}"
-                return RedirectResponse(url=redirect_url)
+                return RedirectResponse(url=redirect_url) # nothing changed, the exported feed is current
             elif le_exist is None:
+                if not series_exist: # fetch before writing anything, so a failed fetch leaves no list entry behind
+                    sdata, edata = await fetch_show_and_episodes(series_id)
+                    if sdata is None or edata is None:
+                        logger.error(f"add_to_series: no show or episode data from tvmaze. series_id: {series_id}")
+                        message = f"Error: {series_name} could not be fetched from TVmaze. Please try again later."
+                        return templates.TemplateResponse(request, "index.html", {"message": message, "popular_tv_shows": popular_tv_shows})
                 add_series = ListEntries(list_id=int(list_id), series_id=int(series_id))
                 session.add(add_series)
-                session.commit()
+                await session.commit()
+                feed_cache.invalidate(list_id)
 
                 audit_log_entry = AuditLogEntry(
                     msg_type_id = 1,
@@ -99,19 +127,11 @@ async def add_to_series(request: Request):
                     created_at = datetime.now()
                 )
                 session.add(audit_log_entry)
-                session.commit()
+                await session.commit()
 
                 # Series logic
                 if not series_exist:
                     today = datetime.now()
-                    series_url = f"https://api.tvmaze.com/shows/{series_id}"
-                    episode_url = f"https://api.tvmaze.com/shows/{series_id}/episodes"
-                    # Create async tasks
-                    task1 = asyncio.create_task(fetch_data(series_url))
-                    task2 = asyncio.create_task(fetch_data(episode_url))
-                    # Wait for tasks to complete
-                    sdata = await task1
-                    edata = await task2
                     # Assign series variables
                     series_status = sdata.get("status")
                     series_ext_thetvdb = sdata["externals"].get("thetvdb")
@@ -119,23 +139,25 @@ async def add_to_series(request: Request):
                     # Add TV show to Series
                     series = Series(series_id=int(series_id), series_name=series_name, series_status=series_status, series_ext_thetvdb=series_ext_thetvdb, series_ext_imdb=series_ext_imdb, series_last_updated=today)
                     session.add(series)
-                    session.commit()
-                    episode_task = BackgroundTask(add_episodes, series_id=series_id, edata=edata)
+                    await session.commit()
+                    episode_task = BackgroundTasks()
+                    episode_task.add_task(add_episodes, series_id=series_id, edata=edata)
+                    episode_task.add_task(export_feed, list_id)
                     logger.info(f"{series_name} has been added")
 
                     return templates.TemplateResponse(request, "index.html", {"message": message, "popular_tv_shows": popular_tv_shows}, background=episode_task)
         except PendingRollbackError:
-            session.rollback()
+            await session.rollback()
             logger.error("PendingRollbackError occurred. Transaction was rolled back.")
             message = "An error occurred. Please try again."
             return templates.TemplateResponse(request, "index.html", {"message": message, "popular_tv_shows": popular_tv_shows})
         except Exception as err:
-            session.rollback()
+            await session.rollback()
             logger.error(f"An error occurred: {err}")
             message = "An error occurred while processing your request."
             return templates.TemplateResponse(request, "index.html", {"message": message, "popular_tv_shows": popular_tv_shows})
         redirect_url = f"/list/{list_id}"
-        return RedirectResponse(url=redirect_url)
+        return RedirectResponse(url=redirect_url, background=BackgroundTask(export_feed, list_id))
 
 # move TV show from Main to Archive
 async def add_to_archive(request: Request):
@@ -149,37 +171,38 @@ async def add_to_archive(request: Request):
     except:
         message = "Error: Invalid input. Try again, but no tricks this time"
         return templates.TemplateResponse(request, "index.html", {"message": message})
-    with SessionLocal() as session:
-        show_exists = session.scalars(select(ListEntries).where(
+    async with AsyncSessionLocal() as session:
+        show_exists = (await session.scalars(select(ListEntries).where(
                 ListEntries.list_id == int(list_id),
                 ListEntries.series_id == int(series_id)
             )
-        ).first()
+        )).first()
         if show_exists is not None:
-            session.execute(update(ListEntries).where(
+            await session.execute(update(ListEntries).where(
                         ListEntries.list_id == int(list_id),
                         ListEntries.series_id == int(series_id)
                     )
                     .values(archive=1)
                     .execution_options(synchronize_session="fetch"))
-            session.commit()
+            await session.commit()
+            feed_cache.invalidate(list_id)
 
-    audit_log_entry = AuditLogEntry(
-        msg_type_id = 2,
-        msg_type_name = "series_archive",
-        ip = request.client.host,
-        list_id = list_id,
-        list_name = None,
-        prev_list_name = None,
-        series_id = series_id,
-        series_name = series_name,
-        created_at = datetime.now()
-    )
-    session.add(audit_log_entry)
-    session.commit()
+        audit_log_entry = AuditLogEntry(
+            msg_type_id = 2,
+            msg_type_name = "series_archive",
+            ip = request.client.host,
+            list_id = list_id,
+            list_name = None,
+            prev_list_name = None,
+            series_id = series_id,
+            series_name = series_name,
+            created_at = datetime.now()
+        )
+        session.add(audit_log_entry)
+        await session.commit()
     
     redirect_url = f"/list/{list_id}"
-    return RedirectResponse(url=redirect_url)
+    return RedirectResponse(url=redirect_url, background=BackgroundTask(export_feed, list_id))
 
 # helper function to filter search results against series in lists
 def build_available_lists(lists, list_entries):
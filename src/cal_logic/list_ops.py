@@ -5,15 +5,15 @@ import re
 from datetime import datetime
 
 from src.services.templates import templates
-from src.db import SessionLocal
+from src.db import AsyncSessionLocal
 from src.models import Lists, AuditLogEntry
 
 async def create_list(request: Request):
-    with SessionLocal() as session:
-        lists = session.execute(select(Lists)).scalars().all()
+    async with AsyncSessionLocal() as session:
+        lists = (await session.execute(select(Lists))).scalars().all()
         form_data = await request.form()
         user_input = form_data.get('create-list')
-        name_check = session.execute(select(Lists).where(Lists.list_name == user_input)).scalars().first()
+        name_check = (await session.execute(select(Lists).where(Lists.list_name == user_input))).scalars().first()
         # validate to only accept letters and numbers
         pattern = r'^[a-zA-Z0-9]+$'
         if not re.match(pattern, user_input):
@@ -23,8 +23,8 @@ async def create_list(request: Request):
             if not name_check:
                 new_list = Lists(list_name=user_input)
                 session.add(new_list)
-                session.commit()
-                lists = session.execute(select(Lists)).scalars().all()
+                await session.commit()
+                lists = (await session.execute(select(Lists))).scalars().all()
                 
                 message = f"{user_input} has been created"
                 list_id = new_list.list_id
@@ -41,7 +41,7 @@ async def create_list(request: Request):
                     created_at = datetime.now()
                 )
                 session.add(audit_log_entry)
-                session.commit()
+                await session.commit()
                 
                 return templates.TemplateResponse(request, 'lists.html', {'message': message, 'lists': lists})
             else:
@@ -52,8 +52,8 @@ async def rename_list(request: Request):
     form_data = await request.form()
     list_id_form = form_data.get('list-id')
     user_input = form_data.get("rename-list")
-    with SessionLocal() as session:
-        prev = session.execute(select(Lists).where(Lists.list_id == list_id_form)).scalar_one()
+    async with AsyncSessionLocal() as session:
+        prev = (await session.execute(select(Lists).where(Lists.list_id == list_id_form))).scalar_one()
         prev_list_name = prev.list_name
         try: # validate input
             list_id = int(list_id_form)
@@ -65,18 +65,18 @@ async def rename_list(request: Request):
         if not re.match(pattern, user_input):
             message = "Only letters and numbers are accepted"
             return templates.TemplateResponse(request, 'index.html', {'message': message})
-        name_check = session.execute(select(func.count()).where(Lists.list_name == user_input)).scalar_one()
+        name_check = (await session.execute(select(func.count()).where(Lists.list_name == user_input))).scalar_one()
 
         if name_check > 0:
             message = "A list with that name exists already"
             return templates.TemplateResponse(request, 'index.html', {'message': message})
         else:
-            session.execute(update(Lists)
+            await session.execute(update(Lists)
                 .where(Lists.list_id == int(list_id))
                 .values(list_name=user_input)
                 .execution_options(synchronize_session='fetch')
             )
-            session.commit()
+            await session.commit()
 
             audit_log_entry = AuditLogEntry(
                 msg_type_id = 5,
@@ -90,6 +90,6 @@ async def rename_list(request: Request):
                 created_at = datetime.now()
             )
             session.add(audit_log_entry)
-            session.commit()
+            await session.commit()
             
         return RedirectResponse(url=f"/list/{list_id}")
@@ -1,64 +1,228 @@
 from starlette.requests import Request
-from starlette.responses import StreamingResponse
+from starlette.responses import StreamingResponse, Response, RedirectResponse, PlainTextResponse, FileResponse
 from sqlalchemy import select
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+import hashlib
 import logging
-import io
+import os
+import tempfile
 
 from src.models import ListEntries, Series, Episodes
 from src.db import SessionLocal
+from src.cal_logic.dates import ics_dates, STORED_EPISODE_DAYS
+from src.cal_logic.cache import FeedEntry, content_etag, feed_cache, fragment_cache, feed_timestamp, format_http_date, choose_encoding, is_not_modified, feed_path, read_feed_etag, representation_etag
 
 logger = logging.getLogger(__name__)
 
-# download calendar
-def download_calendar(request: Request):
-    list_id = request.path_params['list_id']
-    calendar_file_memory = io.BytesIO()
-    calendar_file_memory.write(b"BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:nousa\nCALSCALE:GREGORIAN\n")
+# episodes are fetched from the db and written to the client in chunks of this many rows
+CALENDAR_CHUNK_SIZE = int(os.getenv("CALENDAR_CHUNK_SIZE", "500"))
+# feeds larger than this are not kept in feed_cache but spooled to a temporary file, so memory stays flat for huge lists
+FEED_CACHE_MAX_BYTES = int(os.getenv("FEED_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CALENDAR_FILE_CHUNK_SIZE = 64 * 1024 # bytes per read from a spooled feed
+# default date window of a feed, relative to today. clients can ask for another window with ?from=&to=
+CALENDAR_WINDOW_PAST_DAYS = int(os.getenv("CALENDAR_WINDOW_PAST_DAYS", "365"))
+CALENDAR_WINDOW_FUTURE_DAYS = int(os.getenv("CALENDAR_WINDOW_FUTURE_DAYS", "365"))
+# upper bound on the number of lists in one /subscribe/merge feed
+CALENDAR_MERGE_MAX_LISTS = int(os.getenv("CALENDAR_MERGE_MAX_LISTS", "10"))
 
-    with SessionLocal() as session:
-        shows = session.execute(select(Series)
-            .join(ListEntries, Series.series_id == ListEntries.series_id)
-            .where(ListEntries.list_id == list_id)
-        ).scalars().all()
+CALENDAR_HEADER = b"BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:nousa\nCALSCALE:GREGORIAN\n"
+CALENDAR_FOOTER = b"END:VCALENDAR"
+
+def render_event(show, episode, now):
+    start_convert, end_convert = episode.ep_ics_start, episode.ep_ics_end
+    if start_convert is None or end_convert is None: # rows written before the dates were stored
+        start_convert, end_convert = ics_dates(episode.ep_airdate)
+
+    return (
+        "BEGIN:VEVENT\n"
+        f"DTSTAMP:{now:%Y%m%d}T{now:%H%M%S}Z\n"
+        f"DTSTART;VALUE=DATE:{start_convert}\n"
+        f"DTEND;VALUE=DATE:{end_convert}\n"
+        f"DESCRIPTION:Episode name: {episode.ep_name}\\nLast updated: {show.series_last_updated:%d-%b-%Y %H:%M}\\nIMDb ID: {show.series_ext_imdb}\n"
+        f"SUMMARY:{show.series_name} S{episode.ep_season or 0:02d}E{episode.ep_number or 0:02d}\n"
+        f"UID:{episode.ep_id}\n"
+        "BEGIN:VALARM\n"
+        f"UID:{episode.ep_id}A\n"
+        "ACTION:DISPLAY\n"
+        f"TRIGGER;VALUE=DATE-TIME:{start_convert}T170000Z\n"
+        f"DESCRIPTION:{show.series_name} is on tv today!\n"
+        "END:VALARM\n"
+        "END:VEVENT\n"
+    )
+
+# VEVENT of an episode from fragment_cache, rendered only when the episode or its show changed
+def render_fragment(show, episode, now):
+    fragment = fragment_cache.get(show.series_id, episode.ep_id, show.series_last_updated)
+    if fragment is None:
+        fragment = render_event(show, episode, now).encode('utf-8')
+        fragment_cache.put(show.series_id, episode.ep_id, show.series_last_updated, fragment)
+    return fragment
 
-        episodes = session.execute(select(Episodes)
-            .join(ListEntries, Episodes.ep_series_id == ListEntries.series_id)
+# airdate window of a feed as (first day, last day), both inclusive. raises ValueError on bad input.
+# windows are clamped to the STORED_EPISODE_DAYS around today, there are no episodes outside of it
+def calendar_window(query_params):
+    today = date.today()
+    start = today - timedelta(days=CALENDAR_WINDOW_PAST_DAYS)
+    end = today + timedelta(days=CALENDAR_WINDOW_FUTURE_DAYS)
+    if query_params.get("from"):
+        start = date.fromisoformat(query_params["from"])
+    if query_params.get("to"):
+        end = date.fromisoformat(query_params["to"])
+    if end < start:
+        raise ValueError("'to' is before 'from'")
+    start = max(start, today - timedelta(days=STORED_EPISODE_DAYS))
+    end = min(end, today + timedelta(days=STORED_EPISODE_DAYS))
+    return start, end
+
+# generator yielding the calendar of one or more lists in chunks. one joined query ordered by series and
+# airdate returns every (episode, show) pair in the window, read in partitions of CALENDAR_CHUNK_SIZE rows, so
+# rendering is linear in the number of episodes and memory does not grow with the size of the list.
+# series are selected with IN (...) so a series on several of the lists is emitted once.
+# the airdate filter is a range scan on ix_Episodes_ep_series_id_ep_airdate
+def iter_calendar(list_ids, start=None, end=None):
+    if start is None or end is None:
+        start, end = calendar_window({})
+    with SessionLocal() as session:
+        rows = session.execute(select(Episodes, Series)
+            .join(Series, Episodes.ep_series_id == Series.series_id)
             .where(
-                ListEntries.list_id == list_id,
-                ListEntries.archive == 0
+                Series.series_id.in_(select(ListEntries.series_id).where(
+                    ListEntries.list_id.in_(list_ids),
+                    ListEntries.archive == 0
+                )),
+                Episodes.ep_airdate >= datetime.combine(start, datetime.min.time()),
+                Episodes.ep_airdate < datetime.combine(end + timedelta(days=1), datetime.min.time())
             )
-        ).scalars().all()
-
-        for show in shows:
-            for episode in episodes:
-                if episode.ep_series_id == show.series_id:
-                    now = datetime.now()
-                    ep_start = episode.ep_airdate + timedelta(days=1) # add one day for proper calendar event start date
-                    ep_end = episode.ep_airdate + timedelta(days=2) # add two days for event end
-                    start_convert = datetime.strftime(ep_start,'%Y%m%d') # convert datetime object to string
-                    end_convert = datetime.strftime(ep_end,'%Y%m%d') # convert datetime object to string
-                    
-                    calendar_event = (
-                        "BEGIN:VEVENT\n"
-                        f"DTSTAMP:{now:%Y%m%d}T{now:%H%M%S}Z\n"
-                        f"DTSTART;VALUE=DATE:{start_convert}\n"
-                        f"DTEND;VALUE=DATE:{end_convert}\n"
-                        f"DESCRIPTION:Episode name: {episode.ep_name}\\nLast updated: {show.series_last_updated:%d-%b-%Y %H:%M}\\nIMDb ID: {show.series_ext_imdb}\n"
-                        f"SUMMARY:{show.series_name} S{int(episode.ep_season):02d}E{int(episode.ep_number):02d}\n"
-                        f"UID:{episode.ep_id}\n"
-                        "BEGIN:VALARM\n"
-                        f"UID:{episode.ep_id}A\n"
-                        "ACTION:DISPLAY\n"
-                        f"TRIGGER;VALUE=DATE-TIME:{start_convert}T170000Z\n"
-                        f"DESCRIPTION:{show.series_name} is on tv today!\n"
-                        "END:VALARM\n"
-                        "END:VEVENT\n"
-                    )
-                    
-                    calendar_file_memory.write(calendar_event.encode('utf-8'))
-        calendar_file_memory.write(b"END:VCALENDAR")
-        calendar_file_memory.seek(0)
-        logger.info(f"Calendar from {list_id} was downloaded from IP: {request.client.host}")
-        headers = {'Content-Disposition': 'attachment; filename="nousa.ics"'}
-        return StreamingResponse(calendar_file_memory, media_type="text/calendar", headers=headers)
\ No newline at end of file
+            .order_by(Series.series_id, Episodes.ep_airdate)
+            .execution_options(yield_per=CALENDAR_CHUNK_SIZE)
+        )
+
+        yield CALENDAR_HEADER
+        for partition in rows.partitions():
+            now = datetime.now()
+            yield b''.join([render_fragment(show, episode, now) for episode, show in partition])
+        yield CALENDAR_FOOTER
+
+# render the calendar of one or more lists to bytes
+def render_calendar(list_ids, start=None, end=None):
+    return b''.join(iter_calendar(list_ids, start, end))
+
+# render a feed that is not cached before it is sent, so the db session is closed before a slow client
+# starts reading. with `cache` set, feeds up to FEED_CACHE_MAX_BYTES are stored in feed_cache and returned
+# as a FeedEntry. other feeds are returned as (file, etag, last_modified): spooled to a temporary file
+def render_feed(key, list_ids, start, end, cache=True):
+    generation = feed_cache.generation(list_ids)
+    last_modified = feed_timestamp()
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=FEED_CACHE_MAX_BYTES)
+    size = 0
+    try:
+        for chunk in iter_calendar(list_ids, start, end):
+            digest.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    if not cache or size > FEED_CACHE_MAX_BYTES:
+        return spool, content_etag(digest), last_modified
+    with spool:
+        return feed_cache.store(key, spool.read(), generation, last_modified=last_modified)
+
+# read a spooled feed in CALENDAR_FILE_CHUNK_SIZE blocks and close it when done
+def iter_spool(spool):
+    with spool:
+        while chunk := spool.read(CALENDAR_FILE_CHUNK_SIZE):
+            yield chunk
+
+# FileResponse for an exported feed, None when the list has not been exported (yet)
+def exported_feed_response(request, list_id, headers):
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
+    path = feed_path(list_id, encoding)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag = read_feed_etag(list_id)
+    if etag is None: # exported before etags were stored with the feed
+        return None
+    last_modified = datetime.fromtimestamp(int(stat_result.st_mtime), timezone.utc)
+    headers['ETag'] = representation_etag(etag, encoding)
+    headers['Last-Modified'] = format_http_date(last_modified)
+    if is_not_modified(request.headers, headers['ETag'], last_modified):
+        return Response(status_code=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    logger.info(f"Calendar from {list_id} was downloaded from IP: {request.client.host}")
+    return FileResponse(path, media_type="text/calendar", headers=headers, filename="nousa.ics")
+
+# feed response for one or more lists, from an exported file, feed_cache or a live render.
+# only default window feeds are exported and cached, other windows are rendered on every request
+def calendar_response(request, list_ids, start, end, default_window=True):
+    headers = {
+        'Cache-Control': 'no-cache', # clients may keep the feed but have to revalidate it
+        'Vary': 'Accept-Encoding'
+    }
+    label = ','.join(str(list_id) for list_id in list_ids)
+    # the default window of a list is exported to disk after every change and sent with sendfile
+    if default_window and len(list_ids) == 1:
+        response = exported_feed_response(request, list_ids[0], headers)
+        if response is not None:
+            return response
+
+    key = (list_ids, start, end)
+    feed = feed_cache.get(key) if default_window else None
+    if feed is None:
+        feed = render_feed(key, list_ids, start, end, cache=default_window)
+    if isinstance(feed, FeedEntry):
+        encoding = choose_encoding(request.headers.get('accept-encoding'))
+        headers['ETag'] = feed.etag_for(encoding)
+        headers['Last-Modified'] = feed.last_modified_http
+        if feed.is_not_modified(request.headers, encoding):
+            return Response(status_code=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        body = iter([feed.encoded(encoding)])
+    else: # not cached, sent uncompressed from the spooled file
+        spool, etag, last_modified = feed
+        headers['ETag'] = etag
+        headers['Last-Modified'] = format_http_date(last_modified)
+        if is_not_modified(request.headers, etag, last_modified):
+            spool.close()
+            return Response(status_code=304, headers=headers)
+        body = iter_spool(spool)
+
+    logger.info(f"Calendar from {label} was downloaded from IP: {request.client.host}")
+    headers['Content-Disposition'] = 'attachment; filename="nousa.ics"'
+    return StreamingResponse(body, media_type="text/calendar", headers=headers)
+
+# download calendar, e.g. /subscribe/1?from=2026-01-01&to=2026-03-31
+# default window feeds are served from disk or feed_cache until a write path invalidates them
+def download_calendar(request: Request):
+    try:
+        list_id = int(request.path_params['list_id'])
+    except:
+        return RedirectResponse(url="/")
+    try:
+        start, end = calendar_window(request.query_params)
+    except ValueError as err:
+        return PlainTextResponse(f"Invalid date window, use ?from=YYYY-MM-DD&to=YYYY-MM-DD: {err}", status_code=400)
+    default_window = not request.query_params.get('from') and not request.query_params.get('to')
+    return calendar_response(request, (list_id,), start, end, default_window=default_window)
+
+# one calendar for several lists, e.g. /subscribe/merge?lists=1,2,3
+# episodes of series that are on more than one of the lists are only sent once
+def download_merged_calendar(request: Request):
+    try:
+        list_ids = tuple(sorted({int(list_id) for list_id in request.query_params.get('lists', '').split(',') if list_id.strip()}))
+    except ValueError:
+        return PlainTextResponse("Invalid lists, use ?lists=1,2,3", status_code=400)
+    if not list_ids or len(list_ids) > CALENDAR_MERGE_MAX_LISTS:
+        return PlainTextResponse(f"Pass between 1 and {CALENDAR_MERGE_MAX_LISTS} list ids, e.g. ?lists=1,2,3", status_code=400)
+    try:
+        start, end = calendar_window(request.query_params)
+    except ValueError as err:
+        return PlainTextResponse(f"Invalid date window, use ?from=YYYY-MM-DD&to=YYYY-MM-DD: {err}", status_code=400)
+    default_window = not request.query_params.get('from') and not request.query_params.get('to')
+    return calendar_response(request, list_ids, start, end, default_window=default_window)
@@ -1,22 +1,87 @@
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
+from starlette.background import BackgroundTask
 from datetime import datetime
-from sqlalchemy import update, delete, select, func
+from sqlalchemy import update, delete, select, func, insert
 from sqlalchemy.orm import Session
+import asyncio
 import logging
+import aiohttp
 
 from src.services.templates import templates
-from src.db import SessionLocal
+from src.db import SessionLocal, AsyncSessionLocal
 from src.models import Series, Episodes, AuditLogEntry, ListEntries
+from src.cal_logic.cache import feed_cache, fragment_cache
+from src.cal_logic.export import export_feed, export_series_feeds
+from src.services.tvmaze import forget_series
 
 logger = logging.getLogger(__name__)
 
-def series_update(series_id, db: Session = None):
-    # imports go here to prevent circular import error
-    from src.cal_logic.gather import try_request_series, try_request_episodes
-    from src.cal_logic.input import add_episodes
-    sdata = try_request_series(series_id)
-    edata = try_request_episodes(series_id)
+EPISODE_FIELDS = ("ep_name", "ep_season", "ep_number", "ep_airdate")
+
+def _same_value(stored, fetched):
+    if stored is None or fetched is None:
+        return stored is fetched
+    return stored == fetched
+
+# bring the stored episodes of a series in line with tvmaze episode data: update changed rows, insert new
+# rows and delete rows that are no longer in the data (or moved out of the one year window).
+# runs inside the caller's transaction and returns the number of rows per outcome
+def reconcile_episodes(session, series_id, edata):
+    from src.cal_logic.input import episode_rows # import here to prevent circular import error
+    fetched = {row["ep_id"]: row for row in episode_rows(series_id, edata) if row["ep_id"] is not None}
+    stored = {episode.ep_id: episode for episode in session.execute(select(Episodes).where(Episodes.ep_series_id == series_id)).scalars()}
+
+    removed = [ep_id for ep_id in stored if ep_id not in fetched]
+    new_rows = [row for ep_id, row in fetched.items() if ep_id not in stored]
+    changed_rows = [
+        row for ep_id, row in fetched.items()
+        if ep_id in stored and not all(_same_value(getattr(stored[ep_id], field), row[field]) for field in EPISODE_FIELDS)
+    ]
+
+    if removed:
+        session.execute(delete(Episodes).where(Episodes.ep_id.in_(removed)))
+    if new_rows:
+        session.execute(insert(Episodes), new_rows)
+    if changed_rows:
+        session.execute(update(Episodes), changed_rows) # bulk update by primary key
+    return {
+        "inserted": len(new_rows),
+        "updated": len(changed_rows),
+        "deleted": len(removed),
+        "unchanged": len(fetched) - len(new_rows) - len(changed_rows),
+    }
+
+# refresh a series and its episodes for the scheduler: tvmaze is fetched without blocking a worker thread, with backoff.
+# the feeds of the lists with the series are exported again when the refresh changed them.
+# when tvmaze stays unreachable the refresh is scheduled again instead of waiting for it.
+# when tvmaze answers 304 for both the show and its episodes the cached bodies are stored again, which marks
+# the series refreshed and moves the episode window along, without touching the feed caches. a client error (404 for a show removed from tvmaze) is logged and not retried
+async def series_update_async(series_id):
+    from src.cal_logic.gather import fetch_series_update_data, schedule_series_retry
+    try:
+        sdata, edata, not_modified = await fetch_series_update_data(series_id)
+    except aiohttp.ClientResponseError as err:
+        logger.error("series_update failed, tvmaze answered %s, not retrying. series_id: %s", err.status, series_id)
+        return None
+    if sdata is None or edata is None:
+        schedule_series_retry(series_id)
+        if sdata is None:
+            return None
+    counts = await asyncio.to_thread(store_series_update, series_id, sdata, edata, not_modified=not_modified)
+    if feeds_changed(counts, not_modified):
+        await asyncio.to_thread(export_series_feeds, series_id)
+    return counts
+
+# whether a series refresh changed what the feeds of its lists contain
+def feeds_changed(counts, not_modified):
+    return not not_modified or bool(counts and counts["inserted"] + counts["updated"] + counts["deleted"])
+
+# write fetched tvmaze data of a series. the series row and the episode diff are written in one transaction,
+# so feeds never see the series without episodes. episodes are left alone when edata is None.
+# not_modified data is what was stored before, the caches are only invalidated when the episode window moved
+def store_series_update(series_id, sdata, edata, db: Session = None, not_modified=False):
+    counts = None
     if sdata is not None:
         today = datetime.now()
         sdata_name = sdata['name']
@@ -46,13 +111,13 @@ def series_update(series_id, db: Session = None):
 
             # Episodes
             if edata is not None:
-                # Delete old episode data
-                session.execute(delete(Episodes).where(Episodes.ep_series_id == series_id))
-                session.commit()
-                # Add new episode data
-                add_episodes(series_id, edata)
+                counts = reconcile_episodes(session, series_id, edata)
             session.commit()
-            logger.info("series_update success. series_id: %s", series_id)
+            if feeds_changed(counts, not_modified):
+                fragment_cache.evict_series(series_id)
+                feed_cache.invalidate_series(session, series_id)
+            logger.info("series_update success. series_id: %s, episodes: %s, not modified upstream: %s", series_id, counts, not_modified)
+    return counts
 
 # Delete series from list. If series is not on any other list: delete all series data
 async def del_series(request: Request):
@@ -66,18 +131,21 @@ async def del_series(request: Request):
     except:
         message = "Error: Invalid input. Try again, but no tricks this time"
         return templates.TemplateResponse(request, "index.html", {"message": message})
-    with SessionLocal() as session:
-        le_count = session.execute(select(func.count()).where(ListEntries.series_id == series_id)).scalar_one()
+    async with AsyncSessionLocal() as session:
+        le_count = (await session.execute(select(func.count()).where(ListEntries.series_id == series_id))).scalar_one()
         if le_count > 1: # if series is on more than 1 list: delete entry from ListEntries
-            session.execute(delete(ListEntries).where(
+            await session.execute(delete(ListEntries).where(
                 (ListEntries.series_id == series_id) & (ListEntries.list_id == list_id)
             ))
-            session.commit()
+            await session.commit()
         if le_count <= 1: # if series is on 1 or less lists: delete everything
-            session.execute(delete(Episodes).where(Episodes.ep_series_id == series_id))
-            session.execute(delete(ListEntries).where(ListEntries.series_id == series_id))
-            session.execute(delete(Series).where(Series.series_id == series_id))
-            session.commit()
+            await session.execute(delete(Episodes).where(Episodes.ep_series_id == series_id))
+            await session.execute(delete(ListEntries).where(ListEntries.series_id == series_id))
+            await session.execute(delete(Series).where(Series.series_id == series_id))
+            await session.commit()
+            fragment_cache.evict_series(series_id)
+            await asyncio.to_thread(forget_series, series_id)
+        feed_cache.invalidate(list_id)
     
         audit_log_entry = AuditLogEntry(
             msg_type_id = 3,
@@ -91,7 +159,7 @@ async def del_series(request: Request):
             created_at = datetime.now()
         )
         session.add(audit_log_entry)
-        session.commit()
+        await session.commit()
 
         redirect_url = f"/list/{list_id}"
-        return RedirectResponse(url=redirect_url)
\ No newline at end of file
+        return RedirectResponse(url=redirect_url, background=BackgroundTask(export_feed, list_id))
\ No newline at end of file
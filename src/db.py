@@ -1,15 +1,66 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 import logging
-import subprocess
+import os
 
-engine = create_engine("sqlite:///data/nousa.db")
+logger = logging.getLogger(__name__)
+
+# SQLite tuning, applied to every new connection. WAL lets calendar reads run while the scheduler writes
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper() # NORMAL is safe with WAL
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")) # milliseconds a writer waits for a lock
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))) # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-32000")) # negative values are KiB, positive values pages
+
+JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+if SQLITE_JOURNAL_MODE not in JOURNAL_MODES:
+    logger.error(f"Invalid SQLITE_JOURNAL_MODE {SQLITE_JOURNAL_MODE}, using WAL")
+    SQLITE_JOURNAL_MODE = "WAL"
+if SQLITE_SYNCHRONOUS not in SYNCHRONOUS_LEVELS:
+    logger.error(f"Invalid SQLITE_SYNCHRONOUS {SQLITE_SYNCHRONOUS}, using NORMAL")
+    SQLITE_SYNCHRONOUS = "NORMAL"
+
+def configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT:d}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE:d}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE:d}")
+    cursor.close()
+
+engine = create_engine("sqlite:///data/nousa.db", connect_args={"timeout": SQLITE_BUSY_TIMEOUT / 1000})
+event.listen(engine, "connect", configure_sqlite)
 SessionLocal = sessionmaker(bind=engine)
 
-logger = logging.getLogger(__name__)
+# async engine for the starlette handlers, so db i/o does not block the event loop.
+# the scheduler jobs, mail and feed rendering keep using the sync engine above
+async_engine = create_async_engine("sqlite+aiosqlite:///data/nousa.db", connect_args={"timeout": SQLITE_BUSY_TIMEOUT / 1000})
+event.listen(async_engine.sync_engine, "connect", configure_sqlite)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
-# Alembic database migrations
-def db_migrations():
-    result = subprocess.run(["alembic", "upgrade", "head"], capture_output=True, text=True)
-    if result.returncode != 0:
-        logger.error(f"Alembic database migrations failed: {result.stderr}")
\ No newline at end of file
+# Alembic database migrations, run in-process on the app engine.
+# a restart on an up to date database only reads alembic_version and returns
+def db_migrations(alembic_ini="alembic.ini"):
+    config = Config(alembic_ini)
+    config.attributes["configure_logger"] = False # keep the logging set up by setup_logging()
+    try:
+        head = ScriptDirectory.from_config(config).get_current_head()
+        with engine.connect() as conn:
+            current = MigrationContext.configure(conn).get_current_revision()
+        if current == head:
+            logger.info(f"Database is at revision {current}, no migrations to run")
+            return
+        with engine.begin() as conn:
+            config.attributes["connection"] = conn
+            command.upgrade(config, "head")
+        logger.info(f"Database migrated from revision {current} to {head}")
+    except Exception as err:
+        logger.error(f"Alembic database migrations failed: {err}")
@@ -1,3 +1,4 @@
+import asyncio
 from starlette.applications import Starlette
 from starlette.routing import Route, Mount
 from starlette.staticfiles import StaticFiles
@@ -5,22 +6,26 @@ from contextlib import asynccontextmanager
 
 # startup functions
 from src.log_config import setup_logging, delete_files_not_in_use
-from src.db import engine, db_migrations
+from src.db import engine, async_engine, db_migrations
 from src.scheduler import start_scheduler
+from src.services.http import open_session, close_session
+from src.services.search import keep_search_cache_warm, SEARCH_WARMUP_INTERVAL
+from src.routes.template_data import popular_tv_shows
 
 # web routes
-from src.routes.web_routes import homepage, search, list_page, lists_page, download_redirect, jellyrec
+from src.routes.web_routes import homepage, search, autocomplete_shows, list_page, lists_page, download_redirect, jellyrec
 
 # logic routes
 from src.cal_logic.input import add_to_series, add_to_archive
 from src.cal_logic.update import del_series
 from src.cal_logic.list_ops import create_list, rename_list
-from src.cal_logic.output import download_calendar
+from src.cal_logic.output import download_calendar, download_merged_calendar
 
 routes = [
     Route("/", endpoint=homepage, methods=["GET"]),
     Mount("/nousa", app=StaticFiles(directory="static"), name="static"),
     Route("/search", endpoint=search, methods=["GET", "POST"]),
+    Route("/autocomplete", endpoint=autocomplete_shows, methods=["GET"]),
     Route("/add_show", endpoint=add_to_series, methods=["GET", "POST"]),
     Route("/archive_show", endpoint=add_to_archive, methods=["GET", "POST"]),
     Route("/delete_show", endpoint=del_series, methods=["GET", "POST"]),
@@ -29,6 +34,7 @@ routes = [
     Route("/rename_list", endpoint=rename_list, methods=["GET", "POST"]),
     Route("/lists", endpoint=lists_page, methods=["GET", "POST"]),
     Route("/list/{list_id}", endpoint=list_page, methods=["GET", "POST"]),
+    Route("/subscribe/merge", endpoint=download_merged_calendar, methods=["GET"]),
     Route("/subscribe/{list_id}", endpoint=download_calendar, methods=["GET"]),
     Route("/recommendations", endpoint=jellyrec, methods=["GET"])
 ]
@@ -41,12 +47,20 @@ async def lifespan(app: Starlette):
     db_migrations()
     delete_files_not_in_use()
     start_scheduler()
+    await open_session()
+    # popular shows are searched in the background, the app takes requests meanwhile
+    warmup = asyncio.create_task(keep_search_cache_warm(popular_tv_shows)) if SEARCH_WARMUP_INTERVAL > 0 else None
     
     yield  # The app runs while execution is "paused" here
     
     # --- Shutdown Logic ---
     # This runs when the app is shutting down
+    if warmup is not None:
+        warmup.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+    await close_session()
     engine.dispose()
+    await async_engine.dispose()
     print("Shutting down...")
 
 app = Starlette(
@@ -0,0 +1,26 @@
+"""add index on Episodes ep_series_id and ep_airdate
+
+Revision ID: 2b7e4c91d5a3
+Revises: f03e0ca24b22
+Create Date: 2026-10-18 10:12:04.381920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b7e4c91d5a3'
+down_revision: Union[str, None] = 'f03e0ca24b22'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_Episodes_ep_series_id_ep_airdate', 'Episodes', ['ep_series_id', 'ep_airdate'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_Episodes_ep_series_id_ep_airdate', table_name='Episodes')
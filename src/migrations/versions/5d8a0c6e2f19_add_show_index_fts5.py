@@ -0,0 +1,73 @@
+"""add ShowIndex table and ShowSearch fts5 index
+
+Revision ID: 5d8a0c6e2f19
+Revises: 9e1f4b7a3c20
+Create Date: 2026-10-18 16:47:52.610284
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8a0c6e2f19'
+down_revision: Union[str, None] = '9e1f4b7a3c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ShowIndex',
+        sa.Column('series_id', sa.Integer(), primary_key=True),
+        sa.Column('series_name', sa.String(), nullable=False),
+        sa.Column('show_json', sa.String(), nullable=False),
+        sa.Column('weight', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('source', sa.String(), nullable=False, server_default='series'), # series, dump or search
+        sa.Column('indexed_at', sa.DateTime(), nullable=True), # time the full tvmaze show object was stored
+    )
+    op.execute(
+        "CREATE VIRTUAL TABLE ShowSearch USING fts5("
+        "series_name, content='ShowIndex', content_rowid='series_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # keep the fts5 index in line with ShowIndex
+    op.execute(
+        "CREATE TRIGGER ShowIndex_ai AFTER INSERT ON ShowIndex BEGIN "
+        "INSERT INTO ShowSearch(rowid, series_name) VALUES (new.series_id, new.series_name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER ShowIndex_ad AFTER DELETE ON ShowIndex BEGIN "
+        "INSERT INTO ShowSearch(ShowSearch, rowid, series_name) VALUES ('delete', old.series_id, old.series_name); END"
+    )
+    op.execute(
+        "CREATE TRIGGER ShowIndex_au AFTER UPDATE OF series_name ON ShowIndex BEGIN "
+        "INSERT INTO ShowSearch(ShowSearch, rowid, series_name) VALUES ('delete', old.series_id, old.series_name); "
+        "INSERT INTO ShowSearch(rowid, series_name) VALUES (new.series_id, new.series_name); END"
+    )
+    # shows added to or renamed in Series become known shows. archived shows are in Series too,
+    # SeriesArchive and JellyfinRecommendation were dropped by earlier migrations.
+    # json_patch deletes keys patched with null, so status is only patched when Series has one
+    for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE OF series_name, series_status')):
+        op.execute(
+            f"CREATE TRIGGER Series_show_index_{suffix} AFTER {event} ON Series WHEN new.series_name IS NOT NULL BEGIN "
+            "INSERT INTO ShowIndex(series_id, series_name, show_json, weight) "
+            "VALUES (new.series_id, new.series_name, json_object('id', new.series_id, 'name', new.series_name, 'status', new.series_status), 0) "
+            "ON CONFLICT(series_id) DO UPDATE SET series_name = excluded.series_name, show_json = json_patch(ShowIndex.show_json, "
+            "CASE WHEN new.series_status IS NULL THEN json_remove(excluded.show_json, '$.status') ELSE excluded.show_json END); END"
+        )
+    op.execute(
+        "INSERT INTO ShowIndex(series_id, series_name, show_json, weight) "
+        "SELECT series_id, series_name, json_object('id', series_id, 'name', series_name, 'status', series_status), 0 "
+        "FROM Series WHERE series_name IS NOT NULL ON CONFLICT(series_id) DO NOTHING"
+    )
+
+
+def downgrade() -> None:
+    for suffix in ('ai', 'au'):
+        op.execute(f"DROP TRIGGER IF EXISTS Series_show_index_{suffix}")
+    for trigger in ('ShowIndex_ai', 'ShowIndex_ad', 'ShowIndex_au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS ShowSearch")
+    op.drop_table('ShowIndex')
@@ -0,0 +1,42 @@
+"""store Episodes season and number as integers and add precomputed ics dates
+
+Revision ID: 7c5d2e8f1a46
+Revises: 2b7e4c91d5a3
+Create Date: 2026-10-18 14:31:47.205316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c5d2e8f1a46'
+down_revision: Union[str, None] = '2b7e4c91d5a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sqlite can not alter column types, batch mode copies the table and casts the values
+    with op.batch_alter_table('Episodes') as batch_op:
+        batch_op.alter_column('ep_season', existing_type=sa.String(), type_=sa.Integer())
+        batch_op.alter_column('ep_number', existing_type=sa.String(), type_=sa.Integer())
+        batch_op.add_column(sa.Column('ep_ics_start', sa.String(length=8), nullable=True))
+        batch_op.add_column(sa.Column('ep_ics_end', sa.String(length=8), nullable=True))
+    # same keys as ics_dates() in src/cal_logic/dates.py: the day after the airdate and the day after that
+    op.execute(
+        "UPDATE Episodes SET "
+        "ep_ics_start = strftime('%Y%m%d', ep_airdate, '+1 day'), "
+        "ep_ics_end = strftime('%Y%m%d', ep_airdate, '+2 days') "
+        "WHERE ep_airdate IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('Episodes') as batch_op:
+        batch_op.drop_column('ep_ics_end')
+        batch_op.drop_column('ep_ics_start')
+        batch_op.alter_column('ep_number', existing_type=sa.Integer(), type_=sa.String())
+        batch_op.alter_column('ep_season', existing_type=sa.Integer(), type_=sa.String())
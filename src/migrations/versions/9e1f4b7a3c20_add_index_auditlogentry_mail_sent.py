@@ -0,0 +1,26 @@
+"""add index on AuditLogEntry mail_sent and created_at
+
+Revision ID: 9e1f4b7a3c20
+Revises: 7c5d2e8f1a46
+Create Date: 2026-10-18 15:02:19.774103
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e1f4b7a3c20'
+down_revision: Union[str, None] = '7c5d2e8f1a46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_AuditLogEntry_mail_sent_created_at', 'AuditLogEntry', ['mail_sent', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_AuditLogEntry_mail_sent_created_at', table_name='AuditLogEntry')
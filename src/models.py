@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, Integer, String, DateTime, Index, func
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
@@ -19,9 +19,15 @@ class Episodes(Base):
     ep_series_id = Column(Integer)
     ep_id = Column(Integer, primary_key=True)
     ep_name = Column(String)
-    ep_season = Column(String)
-    ep_number = Column(String)
+    ep_season = Column(Integer)
+    ep_number = Column(Integer)
     ep_airdate = Column(DateTime)
+    ep_ics_start = Column(String(8)) # DTSTART of the calendar event as YYYYMMDD, see ics_dates()
+    ep_ics_end = Column(String(8))
+
+    __table_args__ = (
+        Index("ix_Episodes_ep_series_id_ep_airdate", "ep_series_id", "ep_airdate"),
+    )
 
 class SeriesArchive(Base):
     __tablename__ = "SeriesArchive"
@@ -59,6 +65,24 @@ class AuditLogEntry(Base):
     series_name = Column(String, nullable=True)
     mail_sent = Column(Integer, nullable=False, default=0)
 
+    __table_args__ = (
+        # the weekly mail reads mail_sent == 0, the retention job mail_sent == 1 by age
+        Index("ix_AuditLogEntry_mail_sent_created_at", "mail_sent", "created_at"),
+    )
+
+# shows known to the local search index, the fts5 table ShowSearch indexes series_name. see services/show_index.py
+class ShowIndex(Base):
+    __tablename__ = "ShowIndex"
+
+    series_id = Column(Integer, primary_key=True)
+    series_name = Column(String, nullable=False)
+    show_json = Column(String, nullable=False) # show object as returned by tvmaze
+    weight = Column(Integer, nullable=False, default=0) # tvmaze popularity, orders equally ranked matches
+    # where show_json came from: "series" (id, name and status only, filled by triggers on Series),
+    # "dump" (an imported tvmaze show dump) or "search" (tvmaze search results, refreshed after SEARCH_CACHE_TTL)
+    source = Column(String, nullable=False, default="series", server_default="series")
+    indexed_at = Column(DateTime) # utc time show_json was stored from tvmaze, NULL for shows only known from Series
+
 class JellyfinRecommendation(Base):
     __tablename__ = "JellyfinRecommendation"
 
@@ -4,9 +4,11 @@ from starlette.responses import RedirectResponse, JSONResponse, HTMLResponse
 from sqlalchemy import select
 import logging
 
-from src.db import SessionLocal
+from src.db import AsyncSessionLocal
 from src.models import Lists, ListEntries, Series
 from src.services.templates import templates
+from src.services.search import search_shows
+from src.services.show_index import autocomplete
 from src.services.jellyfin import is_jellyfin_api_key_valid, check_jellyfin_env_vars, get_jelly_recs
 from src.routes.template_data import popular_tv_shows
 from src.cal_logic.input import build_available_lists
@@ -52,26 +54,21 @@ async def search(request: Request):
     if search_term:
         series_name = search_term
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(
-                f"https://api.tvmaze.com/search/shows?q={series_name}", timeout=10
-            ) as response:
-                response.raise_for_status()
-                data = await response.json()
-        except aiohttp.ClientError as err:
-            return templates.TemplateResponse(
-                request, 
-                "index.html",
-                {
-                    "popular_tv_shows": popular_tv_shows,
-                    "message": f"Error fetching TV shows: {err}",
-                },
-            )
-
-    with SessionLocal() as session:
-        lists = session.scalars(select(Lists)).all()
-        list_entries = session.scalars(select(ListEntries)).all()
+    try:
+        data = await search_shows(series_name)
+    except aiohttp.ClientError as err:
+        return templates.TemplateResponse(
+            request, 
+            "index.html",
+            {
+                "popular_tv_shows": popular_tv_shows,
+                "message": f"Error fetching TV shows: {err}",
+            },
+        )
+
+    async with AsyncSessionLocal() as session:
+        lists = (await session.scalars(select(Lists))).all()
+        list_entries = (await session.scalars(select(ListEntries))).all()
         
         available_lists_for_show = build_available_lists(lists, list_entries)
 
@@ -85,10 +82,18 @@ async def search(request: Request):
             }
         )
 
+# json autocomplete of known show names, e.g. /autocomplete?q=the ro
+async def autocomplete_shows(request: Request):
+    try:
+        limit = int(request.query_params.get("limit", 10))
+    except ValueError:
+        limit = 10
+    return JSONResponse(await autocomplete(request.query_params.get("q", ""), limit=max(limit, 1)))
+
 #  route for /lists
 async def lists_page(request: Request):
-    with SessionLocal() as session:
-        lists = session.execute(select(Lists)).scalars().all()
+    async with AsyncSessionLocal() as session:
+        lists = (await session.execute(select(Lists))).scalars().all()
         return templates.TemplateResponse(request, 'lists.html', {'lists': lists, 'selected_lists': True})
 
 # route e.g.: /list/1
@@ -99,10 +104,10 @@ async def list_page(request: Request):
     except:
         return RedirectResponse(url="/")
 
-    with SessionLocal() as session:
-        listentries_list = session.execute(select(ListEntries).where(ListEntries.list_id == list_id)).scalars().all()
-        lists = session.execute(select(Lists)).scalars().all()
-        list_object = session.execute(select(Lists).where(Lists.list_id == list_id)).scalars().first()
+    async with AsyncSessionLocal() as session:
+        listentries_list = (await session.execute(select(ListEntries).where(ListEntries.list_id == list_id))).scalars().all()
+        lists = (await session.execute(select(Lists))).scalars().all()
+        list_object = (await session.execute(select(Lists).where(Lists.list_id == list_id))).scalars().first()
 
         series_array = []
         archive_array = []
@@ -112,8 +117,8 @@ async def list_page(request: Request):
             elif list_item.archive == 1:
                 archive_array.append(list_item.series_id)
 
-        series_list = session.execute(select(Series).where(Series.series_id.in_(series_array)).order_by(Series.series_status.desc())).scalars().all()
-        archive_list = session.execute(select(Series).where(Series.series_id.in_(archive_array)).order_by(Series.series_status.desc())).scalars().all()
+        series_list = (await session.execute(select(Series).where(Series.series_id.in_(series_array)).order_by(Series.series_status.desc()))).scalars().all()
+        archive_list = (await session.execute(select(Series).where(Series.series_id.in_(archive_array)).order_by(Series.series_status.desc()))).scalars().all()
         archive_count = len(archive_list)
         series_count = len(series_list)
 
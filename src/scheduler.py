@@ -10,15 +10,29 @@ from sqlalchemy import select
 import os
 import logging
 from datetime import datetime, timedelta
+from pathlib import Path
 
 from src.models import Series
 from src.db import engine, SessionLocal
 from src.services.mail import send_weekly_notification_email
-from src.cal_logic.update import series_update
+from src.services.audit import purge_audit_log
+from src.cal_logic.update import series_update_async
+from src.cal_logic.export import export_all_feeds
+from src.services.tvmaze import tvmaze, prune_response_cache
 from services.sonarr import sync_nousa_sonarr
 
 logger = logging.getLogger(__name__)
 
+# window of the tvmaze update index the weekly refresh plans with: day, week or month.
+# month leaves room for the cron jitter and for weeks the server was down
+SERIES_REFRESH_SINCE = os.getenv("SERIES_REFRESH_SINCE", "month")
+# time of the last refresh plan, changes before it have been queued already
+SERIES_REFRESH_PLANNED_AT = Path("data/series_refresh_planned_at")
+REFRESH_WINDOWS = {"day": timedelta(days=1), "week": timedelta(weeks=1), "month": timedelta(days=30)}
+if SERIES_REFRESH_SINCE not in REFRESH_WINDOWS:
+    logger.error(f"Invalid SERIES_REFRESH_SINCE {SERIES_REFRESH_SINCE}, using month")
+    SERIES_REFRESH_SINCE = "month"
+
 # scheduler
 jobstores = {
     'default': SQLAlchemyJobStore(engine=engine), 
@@ -63,6 +77,51 @@ def start_scheduler():
     except ConflictingIdError as err:
         logger.error(err)
 
+    # delete mailed audit log entries older than AUDIT_RETENTION_DAYS every night
+    try:
+        scheduler.add_job(
+            func=purge_audit_log,
+            trigger=CronTrigger(hour=3, jitter=600),
+            id="audit_log_retention",
+            name="audit_log_retention",
+            misfire_grace_time=3600,
+            coalesce=True,
+            replace_existing=True,
+            jobstore="default"
+        )
+    except ConflictingIdError as err:
+        logger.error(err)
+
+    # delete cached tvmaze responses that were not used for TVMAZE_CACHE_MAX_AGE_DAYS every night
+    try:
+        scheduler.add_job(
+            func=prune_response_cache,
+            trigger=CronTrigger(hour=3, minute=30, jitter=600),
+            id="tvmaze_cache_retention",
+            name="tvmaze_cache_retention",
+            misfire_grace_time=3600,
+            coalesce=True,
+            replace_existing=True,
+            jobstore="default"
+        )
+    except ConflictingIdError as err:
+        logger.error(err)
+
+    # export calendar feeds to disk at startup and every night, so the default date window moves along
+    try:
+        scheduler.add_job(
+            func=export_all_feeds,
+            trigger=CronTrigger(hour=0, minute=5),
+            id="export_feeds",
+            name="export_feeds",
+            next_run_time=datetime.now(),
+            misfire_grace_time=3600,
+            coalesce=True,
+            jobstore="default"
+        )
+    except ConflictingIdError as err:
+        logger.error(err)
+
     try:
         scheduler.add_job(
             func=sync_nousa_sonarr,
@@ -75,32 +134,70 @@ def start_scheduler():
     except Exception as err:
         logger.error(err)
 
+# {series_id: datetime} of the shows tvmaze changed within SERIES_REFRESH_SINCE, None when the index is unavailable
+def fetch_show_updates(since=SERIES_REFRESH_SINCE):
+    try:
+        updates = tvmaze.get_sync("https://api.tvmaze.com/updates/shows", params={"since": since})
+    except Exception as err:
+        logger.error(f"TVmaze update index unavailable, refreshing every series: {err}")
+        return None
+    return {int(series_id): datetime.fromtimestamp(timestamp) for series_id, timestamp in updates.items()}
+
+# series ids to refresh: the ones tvmaze changed after our last refresh of them. the index only covers the last
+# `window`, so a series is judged by it when it was refreshed or found unchanged (planned_at) within the window.
+# other series are refreshed, and so is every series when there is no index
+def plan_series_refresh(series_rows, updates, now, planned_at=None, window=REFRESH_WINDOWS[SERIES_REFRESH_SINCE]):
+    if updates is None:
+        return [series_id for series_id, last_updated in series_rows]
+    covered_since = now - window
+    index_complete = planned_at is not None and planned_at >= covered_since
+    planned = []
+    for series_id, last_updated in series_rows:
+        if last_updated is None or (last_updated < covered_since and not index_complete):
+            planned.append(series_id)
+        elif series_id in updates and updates[series_id] > last_updated:
+            planned.append(series_id)
+    return planned
+
+def read_refresh_planned_at():
+    try:
+        return datetime.fromisoformat(SERIES_REFRESH_PLANNED_AT.read_text().strip())
+    except (OSError, ValueError):
+        return None
+
 # series_update refreshes series and episodes data. scheduler automates it.
+# only series that changed upstream since their last refresh are queued, see plan_series_refresh
 def schedule_series_update():
     if scheduler.get_job(job_id='update_series'):
         scheduler.remove_job(job_id='update_series')
     with SessionLocal() as session:
-        series_list = session.execute(select(Series.series_id)).scalars().all()
-        # Series
-        for index, series_id in enumerate(series_list):
-            now = datetime.now()
-            job_run_time = now + timedelta(minutes=(5 * index))
-            logger.info(f"job run time: {job_run_time}")
-
-            try:
-                existing_job = scheduler.get_job(job_id=f'series_update_{series_id}')
-                if existing_job:
-                    logger.info(f"series_update_{series_id} job already exists. not adding new job.")
-                else:
-                    scheduler.add_job(
-                        func=series_update,
-                        args=[series_id],
-                        trigger=DateTrigger(run_date=job_run_time),
-                        id=f'series_update_{series_id}',
-                        name=f'series_update_{series_id}',
-                        misfire_grace_time=518400, # 6 days
-                        coalesce=True, # if multiple jobs did not run, discard all others and run only one job.
-                        jobstore='single_show_updates'
-                    )
-            except ConflictingIdError as err:
-                logger.error(err)
\ No newline at end of file
+        series_rows = session.execute(select(Series.series_id, Series.series_last_updated)).all()
+    planned_at = datetime.now()
+    updates = fetch_show_updates()
+    series_list = plan_series_refresh(series_rows, updates, planned_at, planned_at=read_refresh_planned_at())
+    logger.info(f"series_update: {len(series_list)} of {len(series_rows)} series changed upstream")
+    # Series
+    for index, series_id in enumerate(series_list):
+        now = datetime.now()
+        job_run_time = now + timedelta(minutes=(5 * index))
+        logger.info(f"job run time: {job_run_time}")
+
+        try:
+            existing_job = scheduler.get_job(job_id=f'series_update_{series_id}')
+            if existing_job:
+                logger.info(f"series_update_{series_id} job already exists. not adding new job.")
+            else:
+                scheduler.add_job(
+                    func=series_update_async,
+                    args=[series_id],
+                    trigger=DateTrigger(run_date=job_run_time),
+                    id=f'series_update_{series_id}',
+                    name=f'series_update_{series_id}',
+                    misfire_grace_time=518400, # 6 days
+                    coalesce=True, # if multiple jobs did not run, discard all others and run only one job.
+                    jobstore='single_show_updates'
+                )
+        except ConflictingIdError as err:
+            logger.error(err)
+    if updates is not None:
+        SERIES_REFRESH_PLANNED_AT.write_text(planned_at.isoformat())
@@ -0,0 +1,37 @@
+import os
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+
+from src.db import SessionLocal
+from src.models import AuditLogEntry
+
+logger = logging.getLogger(__name__)
+
+# mailed audit log entries are kept this many days after they were created. 0 keeps them forever
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))
+# rows deleted per transaction, so the purge never holds the write lock for long
+AUDIT_RETENTION_BATCH_SIZE = int(os.getenv("AUDIT_RETENTION_BATCH_SIZE", "1000"))
+
+# delete mailed audit log entries created before the retention period, in batches.
+# entries that have not been mailed yet are never deleted. returns the number of deleted rows
+def purge_audit_log(retention_days=AUDIT_RETENTION_DAYS, batch_size=AUDIT_RETENTION_BATCH_SIZE):
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    start = time.perf_counter()
+    removed = 0
+    while True:
+        with SessionLocal() as session:
+            batch = (select(AuditLogEntry.id)
+                .where(AuditLogEntry.mail_sent == 1, AuditLogEntry.created_at < cutoff)
+                .limit(batch_size)
+            )
+            deleted = session.execute(delete(AuditLogEntry).where(AuditLogEntry.id.in_(batch))).rowcount
+            session.commit()
+        removed += deleted
+        if deleted < batch_size:
+            break
+    logger.info(f"Audit log retention: removed {removed} mailed entries created before {cutoff:%Y-%m-%d} in {time.perf_counter() - start:.2f}s")
+    return removed
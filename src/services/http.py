@@ -0,0 +1,51 @@
+import os
+import asyncio
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# connection pool shared by every upstream call (tvmaze, jellyfin)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100")) # open connections in total
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "10"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30")) # seconds an idle connection is kept
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300")) # seconds
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10")) # seconds for a whole request
+
+_sessions = {} # event loop -> its ClientSession
+_closing = set() # close tasks of stale sessions, referenced until they are done
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+
+# sessions of event loops that have been closed can not be used anymore, close them on the running loop
+def _close_stale_sessions(loop):
+    for stale_loop in [stale_loop for stale_loop in _sessions if stale_loop.is_closed()]:
+        task = loop.create_task(_sessions.pop(stale_loop).close())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+# the shared ClientSession of the running event loop. the lifespan handler opens it at startup; code running on
+# another event loop (tests, benchmarks) gets a session of its own, because a session can only be used on the loop it was made on
+def get_session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        _close_stale_sessions(loop)
+        session = _sessions[loop] = _create_session()
+    return session
+
+async def open_session():
+    get_session()
+    logger.info(f"HTTP connection pool opened (limit {HTTP_POOL_LIMIT}, {HTTP_POOL_LIMIT_PER_HOST} per host)")
+
+async def close_session():
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
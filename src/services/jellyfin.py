@@ -3,6 +3,8 @@ import logging
 import aiohttp
 from starlette.requests import Request
 
+from src.services.http import get_session
+
 logger = logging.getLogger(__name__)
 
 JELLYFIN_API_KEY = os.getenv("JELLYFIN_API_KEY", None)
@@ -19,13 +21,12 @@ def check_jellyfin_env_vars():
     return True, "All Jellyfin environment variables are set"
 
 async def is_service_online(name: str, url: str, timeout: int = 5) -> bool:
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, timeout=timeout) as response:
-                return response.status == 200
-        except aiohttp.ClientError as e:
-            logger.warning(f"{name} check failed: {e}")
-            return False
+    try:
+        async with get_session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            return response.status == 200
+    except aiohttp.ClientError as e:
+        logger.warning(f"{name} check failed: {e}")
+        return False
 
 async def are_services_online() -> bool:
     if not BASE_URL:
@@ -34,42 +35,37 @@ async def are_services_online() -> bool:
 
 async def is_jellyfin_api_key_valid() -> bool:
     url = f"{BASE_URL}/Users"
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=HEADERS) as response:
-                return response.status == 200
-        except aiohttp.ClientError:
-            return False
+    try:
+        async with get_session().get(url, headers=HEADERS) as response:
+            return response.status == 200
+    except aiohttp.ClientError:
+        return False
 
 async def get_tv_shows():
     url = f"{BASE_URL}/Items?IncludeItemTypes=Series&Recursive=true"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=HEADERS) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return data.get("Items", [])
+    async with get_session().get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        data = await response.json()
+        return data.get("Items", [])
 
 async def get_episodes(show_id: str):
     url = f"{BASE_URL}/Shows/{show_id}/Episodes"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=HEADERS) as response:
-            response.raise_for_status()
-            data = await response.json()
-            return data.get("Items", [])
+    async with get_session().get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        data = await response.json()
+        return data.get("Items", [])
 
 async def get_users():
     url = f"{BASE_URL}/Users"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=HEADERS) as response:
-            response.raise_for_status()
-            return await response.json()
+    async with get_session().get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        return await response.json()
 
 async def get_show_metadata(user_id: str, item_id: str):
     url = f"{BASE_URL}/Users/{user_id}/Items/{item_id}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=HEADERS) as response:
-            response.raise_for_status()
-            return await response.json()
+    async with get_session().get(url, headers=HEADERS) as response:
+        response.raise_for_status()
+        return await response.json()
 
 async def get_jelly_recs(request: Request):
     if await is_jellyfin_api_key_valid() and await are_services_online():
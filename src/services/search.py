@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+from src.services.tvmaze import tvmaze
+from src.services.show_index import search_local, add_search_results
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600")) # seconds a search result is served from memory
+# the homepage's popular shows are searched at startup and every SEARCH_WARMUP_INTERVAL seconds after,
+# shorter than SEARCH_CACHE_TTL so they never expire. 0 turns the warm-up off
+SEARCH_WARMUP_INTERVAL = float(os.getenv("SEARCH_WARMUP_INTERVAL", "3000"))
+SEARCH_WARMUP_CONCURRENCY = int(os.getenv("SEARCH_WARMUP_CONCURRENCY", "4")) # searches in flight, leaves rate limit tokens for users
+
+if 0 < SEARCH_CACHE_TTL <= SEARCH_WARMUP_INTERVAL:
+    logger.warning(f"SEARCH_WARMUP_INTERVAL {SEARCH_WARMUP_INTERVAL:.0f}s is not below SEARCH_CACHE_TTL {SEARCH_CACHE_TTL:.0f}s, using {SEARCH_CACHE_TTL * 0.8:.0f}s")
+    SEARCH_WARMUP_INTERVAL = SEARCH_CACHE_TTL * 0.8
+
+# "  The  Rookie " and "the rookie" are the same search
+def normalize_query(query):
+    return " ".join((query or "").casefold().split())
+
+# tvmaze search results by normalized query. least recently used entries are dropped once
+# SEARCH_CACHE_MAX_ENTRIES is reached, entries older than SEARCH_CACHE_TTL are fetched again
+class SearchCache:
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (stored_at, results)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, results):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+search_cache = SearchCache()
+
+# search results of query. a query naming a known show is answered from the local show index when
+# tvmaze sent that show within SEARCH_CACHE_TTL, others from search_cache when they were searched
+# recently, else from tvmaze.
+# raises aiohttp.ClientError like tvmaze.get
+async def search_shows(query):
+    key = normalize_query(query)
+    results = await search_local(key, max_age=SEARCH_CACHE_TTL)
+    if results is not None:
+        return results
+    results = search_cache.get(key)
+    if results is None:
+        results = await tvmaze.get("https://api.tvmaze.com/search/shows", params={"q": key})
+        search_cache.put(key, results)
+        await add_search_results(results)
+    return results
+
+# search tvmaze for every query, also when the results are still cached, and store them in both layers
+# search_shows reads: the show index answers queries naming a show exactly and search_cache the others.
+# both count their age from this refresh. returns the number of queries that were warmed
+async def warm_search_cache(queries, concurrency=SEARCH_WARMUP_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(query):
+        key = normalize_query(query)
+        async with semaphore:
+            try:
+                results = await tvmaze.get("https://api.tvmaze.com/search/shows", params={"q": key})
+            except Exception as err:
+                logger.warning(f"Search cache warm-up failed for {query}: {err}")
+                return False
+        search_cache.put(key, results)
+        await add_search_results(results)
+        return True
+
+    warmed = sum(await asyncio.gather(*(warm(query) for query in queries)))
+    logger.info(f"Search cache warmed for {warmed} of {len(queries)} queries")
+    return warmed
+
+# background task started by the lifespan handler, runs until it is cancelled at shutdown
+async def keep_search_cache_warm(queries, interval=SEARCH_WARMUP_INTERVAL):
+    while True:
+        try:
+            await warm_search_cache(queries)
+        except Exception as err: # keep warming on the next round
+            logger.error(f"Search cache warm-up failed: {err}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,158 @@
+import sys
+import json
+import logging
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from src.db import SessionLocal, AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# local full-text index of known tvmaze shows. ShowIndex holds one row per show with its tvmaze json,
+# ShowSearch is an fts5 index over the show names. triggers fill ShowIndex from Series (archived shows
+# included), a tvmaze show dump can be bulk imported with: python -m src.services.show_index shows.json.
+# tvmaze search results are stored too. source tells where a show object came from, indexed_at when
+SHOW_INDEX_BATCH_SIZE = 1000
+AUTOCOMPLETE_MAX_RESULTS = 25
+
+# same schema as migration 5d8a0c6e2f19, for databases built with create_all (tests, benchmarks).
+# test_show_search_ddl_matches_migrations keeps the two in line
+SHOW_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ShowSearch USING fts5("
+    "series_name, content='ShowIndex', content_rowid='series_id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS ShowIndex_ai AFTER INSERT ON ShowIndex BEGIN "
+    "INSERT INTO ShowSearch(rowid, series_name) VALUES (new.series_id, new.series_name); END",
+    "CREATE TRIGGER IF NOT EXISTS ShowIndex_ad AFTER DELETE ON ShowIndex BEGIN "
+    "INSERT INTO ShowSearch(ShowSearch, rowid, series_name) VALUES ('delete', old.series_id, old.series_name); END",
+    "CREATE TRIGGER IF NOT EXISTS ShowIndex_au AFTER UPDATE OF series_name ON ShowIndex BEGIN "
+    "INSERT INTO ShowSearch(ShowSearch, rowid, series_name) VALUES ('delete', old.series_id, old.series_name); "
+    "INSERT INTO ShowSearch(rowid, series_name) VALUES (new.series_id, new.series_name); END",
+) + tuple(
+    f"CREATE TRIGGER IF NOT EXISTS Series_show_index_{suffix} AFTER {event} ON Series WHEN new.series_name IS NOT NULL BEGIN "
+    "INSERT INTO ShowIndex(series_id, series_name, show_json, weight) "
+    "VALUES (new.series_id, new.series_name, json_object('id', new.series_id, 'name', new.series_name, 'status', new.series_status), 0) "
+    "ON CONFLICT(series_id) DO UPDATE SET series_name = excluded.series_name, show_json = json_patch(ShowIndex.show_json, "
+    "CASE WHEN new.series_status IS NULL THEN json_remove(excluded.show_json, '$.status') ELSE excluded.show_json END); END"
+    for suffix, event in (("ai", "INSERT"), ("au", "UPDATE OF series_name, series_status"))
+)
+
+def create_show_search(connection):
+    for statement in SHOW_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+# fts5 query matching every word of query, the last one as a prefix when `prefix` is set.
+# words are quoted, so user input can not use fts5 syntax
+def fts_query(query, prefix=False):
+    words = [f'"{word.replace(chr(34), chr(34) * 2)}"' for word in (query or "").casefold().split()]
+    if not words:
+        return None
+    if prefix:
+        words[-1] += "*"
+    return " ".join(words)
+
+MATCH_SQL = text(
+    "SELECT ShowIndex.series_id, ShowIndex.series_name, ShowIndex.show_json, ShowIndex.source, ShowSearch.rank, "
+    "(julianday('now') - julianday(ShowIndex.indexed_at)) * 86400 AS age "
+    "FROM ShowSearch JOIN ShowIndex ON ShowIndex.series_id = ShowSearch.rowid "
+    "WHERE ShowSearch MATCH :query ORDER BY ShowSearch.rank, ShowIndex.weight DESC LIMIT :limit"
+)
+
+UPSERT_SQL = text(
+    "INSERT INTO ShowIndex(series_id, series_name, show_json, weight, source, indexed_at) "
+    "VALUES (:series_id, :series_name, :show_json, :weight, :source, CURRENT_TIMESTAMP) "
+    "ON CONFLICT(series_id) DO UPDATE SET series_name = excluded.series_name, show_json = excluded.show_json, "
+    "weight = excluded.weight, source = excluded.source, indexed_at = excluded.indexed_at"
+)
+
+async def _match(query, limit):
+    try:
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(MATCH_SQL, {"query": query, "limit": limit})).all()
+    except OperationalError as err: # index not created yet, migrations have not run
+        logger.warning(f"Show index unavailable: {err}")
+        return []
+
+# [{"id", "name"}] of known shows whose name starts with the words of query
+async def autocomplete(query, limit=10):
+    match = fts_query(query, prefix=True)
+    if match is None:
+        return []
+    rows = await _match(match, min(limit, AUTOCOMPLETE_MAX_RESULTS))
+    return [{"id": row.series_id, "name": row.series_name} for row in rows]
+
+# search results shaped like tvmaze's /search/shows, or None when no known show is named exactly query.
+# only full show objects are used: shows only known from Series hold just id, name and status.
+# imported dumps do not expire, objects from search results older than max_age seconds are refreshed
+# from tvmaze by the caller. normalized_query is casefolded with single spaces
+async def search_local(normalized_query, max_age, limit=10):
+    match = fts_query(normalized_query)
+    if match is None:
+        return None
+    results = []
+    exact = False
+    for row in await _match(match, limit):
+        if row.source == "series" or (row.source == "search" and (row.age is None or row.age > max_age)):
+            continue
+        show = json.loads(row.show_json)
+        if " ".join(row.series_name.casefold().split()) == normalized_query:
+            exact = True
+            results.insert(0, {"score": round(-row.rank, 3), "show": show}) # exact match first
+        else:
+            results.append({"score": round(-row.rank, 3), "show": show})
+    return results if exact else None
+
+# store the full show objects of tvmaze search results, so later searches for them are answered locally
+async def add_search_results(results):
+    shows = [
+        {"series_id": int(result["show"]["id"]), "series_name": result["show"]["name"], "show_json": json.dumps(result["show"]), "weight": result["show"].get("weight") or 0, "source": "search"}
+        for result in results if result.get("show", {}).get("id") and result["show"].get("name")
+    ]
+    if not shows:
+        return
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(UPSERT_SQL, shows)
+            await session.commit()
+    except OperationalError as err:
+        logger.warning(f"Show index unavailable: {err}")
+
+# shows of a tvmaze dump: a json array of show objects or one show object per line
+def read_show_dump(path):
+    with open(path, encoding="utf-8") as file:
+        first = file.read(1)
+        file.seek(0)
+        if first == "[":
+            yield from json.load(file)
+            return
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def _upsert_shows(session, shows):
+    session.execute(UPSERT_SQL, shows)
+    session.commit()
+
+# bulk import of a tvmaze show dump into the index, SHOW_INDEX_BATCH_SIZE shows per transaction.
+# returns the number of imported shows
+def import_show_dump(path):
+    imported = 0
+    batch = []
+    with SessionLocal() as session:
+        for show in read_show_dump(path):
+            if not show.get("id") or not show.get("name"):
+                continue
+            batch.append({"series_id": int(show["id"]), "series_name": show["name"], "show_json": json.dumps(show), "weight": show.get("weight") or 0, "source": "dump"})
+            if len(batch) >= SHOW_INDEX_BATCH_SIZE:
+                _upsert_shows(session, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            _upsert_shows(session, batch)
+            imported += len(batch)
+    logger.info(f"Imported {imported} shows from {path} into the show index")
+    return imported
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for dump_path in sys.argv[1:]:
+        import_show_dump(dump_path)
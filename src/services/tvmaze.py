@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import urlencode
+import requests
+
+from src.services.http import get_session, HTTP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# tvmaze allows about 20 calls per 10 seconds per ip and answers 429 beyond that
+TVMAZE_RATE_LIMIT = int(os.getenv("TVMAZE_RATE_LIMIT", "20")) # calls per TVMAZE_RATE_PERIOD
+TVMAZE_RATE_PERIOD = float(os.getenv("TVMAZE_RATE_PERIOD", "10")) # seconds
+TVMAZE_RATE_LIMITED_RETRIES = int(os.getenv("TVMAZE_RATE_LIMITED_RETRIES", "3")) # retries of a call answered with 429
+# bodies and validators of show and episode responses, for conditional requests
+TVMAZE_CACHE_DIR = Path(os.getenv("TVMAZE_CACHE_DIR", "data/tvmaze_cache"))
+TVMAZE_CACHE_MAX_AGE_DAYS = float(os.getenv("TVMAZE_CACHE_MAX_AGE_DAYS", "30")) # entries not used for this long are pruned
+
+# token bucket shared by the event loop and the scheduler threads. reserve() hands out a token and the
+# seconds to wait before it may be used, so callers queue up in order instead of polling
+class TokenBucket:
+    def __init__(self, rate, period):
+        self.capacity = rate
+        self.fill_rate = rate / period # tokens per second
+        self.tokens = float(rate)
+        self.updated = time.monotonic() # lies in the future while a Retry-After pause is running
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            if now > self.updated:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+            self.tokens -= 1
+            return (self.updated - now) + max(0.0, -self.tokens) / self.fill_rate
+
+    # stop handing out tokens for `seconds`; afterwards the bucket refills from empty, so there is no burst
+    def pause(self, seconds):
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self.updated:
+                self.tokens = min(self.tokens, 0.0)
+                self.updated = until
+
+# seconds from a Retry-After header, which is either a number of seconds or an http date
+def retry_after_seconds(value, default=TVMAZE_RATE_PERIOD):
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+# one json file per url with the body and the ETag / Last-Modified it came with.
+# files are replaced atomically, so a crash never leaves a half written entry.
+# the file mtime is the last time an entry was used, prune() drops entries nobody asked for in a while
+class ResponseCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return self.directory / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(self, key):
+        try:
+            return json.loads(self._path(key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, etag, last_modified, body):
+        if not etag and not last_modified: # nothing to revalidate with
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as file:
+            json.dump({"url": key, "etag": etag, "last_modified": last_modified, "body": body}, file)
+        os.replace(file.name, self._path(key))
+
+    # mark an entry as used, after tvmaze confirmed it with a 304
+    def touch(self, key):
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    # delete entries not used for max_age seconds. returns the number of deleted entries
+    def prune(self, max_age):
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in self.directory.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+# request headers that turn a request into a conditional one
+def validators(entry):
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def cache_key(url, params):
+    return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+# every call to api.tvmaze.com goes through this client, so the async routes and the
+# blocking scheduler jobs share one rate limit
+class TVmazeClient:
+    def __init__(self, limiter, cache):
+        self.limiter = limiter
+        self.cache = cache
+        self._local = threading.local() # a requests.Session per scheduler thread, sessions are not thread-safe
+
+    # pooled connections for the blocking callers of the current thread
+    def _requests(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _rate_limited(self, url, retry_after):
+        seconds = retry_after_seconds(retry_after)
+        logger.warning(f"TVmaze rate limit hit on {url}, pausing {seconds:.1f}s")
+        self.limiter.pause(seconds)
+
+    # json of url. raises aiohttp.ClientError on http errors, also when 429 persists.
+    # with cache=True the request is conditional and a 304 is answered from the disk cache
+    async def get(self, url, params=None, cache=False):
+        data, not_modified = await self.get_cached(url, params=params, cache=cache)
+        return data
+
+    # (json, not_modified) of url, not_modified is True when the body came from the disk cache
+    async def get_cached(self, url, params=None, cache=False):
+        key = cache_key(url, params)
+        entry = await asyncio.to_thread(self.cache.get, key) if cache else None
+        for attempt in range(TVMAZE_RATE_LIMITED_RETRIES + 1):
+            await asyncio.sleep(self.limiter.reserve())
+            async with get_session().get(url, params=params, headers=validators(entry)) as response:
+                if response.status == 429 and attempt < TVMAZE_RATE_LIMITED_RETRIES:
+                    self._rate_limited(url, response.headers.get("Retry-After"))
+                    continue
+                if response.status == 304 and entry is not None:
+                    await asyncio.to_thread(self.cache.touch, key)
+                    return entry["body"], True
+                response.raise_for_status()
+                data = await response.json()
+                if cache:
+                    await asyncio.to_thread(self.cache.put, key, response.headers.get("ETag"), response.headers.get("Last-Modified"), data)
+                return data, False
+
+    # blocking variant for code running in worker threads. raises requests.RequestException
+    def get_sync(self, url, params=None, timeout=HTTP_TIMEOUT):
+        for attempt in range(TVMAZE_RATE_LIMITED_RETRIES + 1):
+            time.sleep(self.limiter.reserve())
+            response = self._requests().get(url, params=params, timeout=timeout)
+            if response.status_code == 429 and attempt < TVMAZE_RATE_LIMITED_RETRIES:
+                self._rate_limited(url, response.headers.get("Retry-After"))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+tvmaze = TVmazeClient(TokenBucket(TVMAZE_RATE_LIMIT, TVMAZE_RATE_PERIOD), ResponseCache(TVMAZE_CACHE_DIR))
+
+# urls of a series the disk cache can hold, see fetch_show_and_episodes and fetch_series_update_data
+def series_urls(series_id):
+    return (
+        f"https://api.tvmaze.com/shows/{series_id}",
+        f"https://api.tvmaze.com/shows/{series_id}/episodes",
+        f"https://api.tvmaze.com/shows/{series_id}?embed=episodes",
+    )
+
+# drop the cached responses of a series that is no longer on any list
+def forget_series(series_id):
+    for url in series_urls(series_id):
+        tvmaze.cache.delete(url)
+
+# nightly job: remove cached responses not used for TVMAZE_CACHE_MAX_AGE_DAYS
+def prune_response_cache(max_age_days=TVMAZE_CACHE_MAX_AGE_DAYS):
+    removed = tvmaze.cache.prune(max_age_days * 86400)
+    logger.info(f"TVmaze response cache: removed {removed} entries unused for {max_age_days} days")
+    return removed
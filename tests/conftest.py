@@ -1,9 +1,15 @@
+from unittest.mock import MagicMock
+import aiohttp
 import pytest
+import pytest_asyncio
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from src.models import Base  # your declarative Base
+from src.cal_logic.cache import feed_cache, fragment_cache
+from src.services.search import search_cache
 
 TEST_DATABASE_URL = "sqlite:///:memory:"
 
@@ -28,4 +34,53 @@ def db_session():
         yield session
     finally:
         session.close()
-        Base.metadata.drop_all(bind=engine)
\ No newline at end of file
+        Base.metadata.drop_all(bind=engine)
+
+# the request handlers use AsyncSessionLocal, so they get an aiosqlite session
+@pytest_asyncio.fixture(scope="function")
+async def async_db_session():
+    async_engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session = async_sessionmaker(bind=async_engine, expire_on_commit=False)()
+    try:
+        yield session
+    finally:
+        await session.close()
+        await async_engine.dispose()
+
+@pytest.fixture(autouse=True)
+def clear_feed_cache():
+    # rendered feeds are cached per list_id, which the in-memory db reuses between tests
+    feed_cache.clear()
+    fragment_cache.clear()
+    search_cache.clear()
+    yield
+    feed_cache.clear()
+    fragment_cache.clear()
+    search_cache.clear()
+
+# stands in for an aiohttp response of the shared session, use it as the side_effect of session.get
+class FakeResponse:
+    def __init__(self, status, data=None, headers=None):
+        self.status = status
+        self._data = data
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(MagicMock(), (), status=self.status, headers=self.headers)
+
+    async def json(self):
+        return self._data
+
+@pytest.fixture
+def fake_response():
+    return FakeResponse
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from src.models import AuditLogEntry
+from src.services.audit import purge_audit_log
+
+
+def test_purge_audit_log_removes_old_mailed_entries_in_batches(db_session):
+    now = datetime.now()
+    old = now - timedelta(days=120)
+    db_session.add_all(
+        [AuditLogEntry(msg_type_id=1, msg_type_name="series_add", ip="127.0.0.1", created_at=old, mail_sent=1) for _ in range(5)]
+        + [
+            AuditLogEntry(id=100, msg_type_id=1, msg_type_name="series_add", ip="127.0.0.1", created_at=old, mail_sent=0), # not mailed yet
+            AuditLogEntry(id=101, msg_type_id=1, msg_type_name="series_add", ip="127.0.0.1", created_at=now, mail_sent=1), # recent
+        ]
+    )
+    db_session.commit()
+
+    with patch('src.services.audit.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        removed = purge_audit_log(retention_days=90, batch_size=2)
+
+    assert removed == 5
+    assert mock_factory.call_count == 3 # batches of 2, 2 and 1
+    assert sorted(entry.id for entry in db_session.query(AuditLogEntry).all()) == [100, 101]
+
+
+def test_purge_audit_log_keeps_old_unmailed_entries(db_session):
+    db_session.add(AuditLogEntry(id=1, msg_type_id=1, msg_type_name="series_add", ip="127.0.0.1", created_at=datetime.now() - timedelta(days=365), mail_sent=0))
+    db_session.commit()
+
+    with patch('src.services.audit.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        assert purge_audit_log(retention_days=90) == 0
+
+    assert db_session.get(AuditLogEntry, 1) is not None
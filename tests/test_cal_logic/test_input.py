@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from sqlalchemy import select
+from starlette.requests import Request
+
+from src.cal_logic.input import add_episodes, add_to_series
+from src.models import Episodes, Series, ListEntries, Lists
+
+
+def test_add_episodes_inserts_window_in_one_transaction(db_session):
+    today = datetime.now()
+    edata = [
+        {"id": 1, "name": "Old", "season": 1, "number": 1, "airdate": (today - timedelta(days=400)).strftime("%Y-%m-%d")},
+        {"id": 2, "name": "Recent", "season": 1, "number": 2, "airdate": (today - timedelta(days=10)).strftime("%Y-%m-%d")},
+        {"id": 3, "name": "Upcoming", "season": 1, "number": 3, "airdate": (today + timedelta(days=10)).strftime("%Y-%m-%d")},
+        {"id": 4, "name": "TBA", "season": 1, "number": 4, "airdate": ""},
+        {"id": 5, "name": "Far future", "season": 2, "number": 1, "airdate": (today + timedelta(days=400)).strftime("%Y-%m-%d")},
+    ]
+
+    with patch('src.cal_logic.input.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        added = add_episodes(7, edata)
+
+    assert added == 2
+    assert mock_factory.call_count == 1
+    stored = db_session.query(Episodes).order_by(Episodes.ep_id).all()
+    assert [episode.ep_id for episode in stored] == [2, 3]
+    assert all(episode.ep_series_id == 7 for episode in stored)
+    # the calendar event dates are stored with the episode, so the feed renderer does not compute them
+    assert stored[0].ep_ics_start == (today - timedelta(days=9)).strftime("%Y%m%d")
+    assert stored[0].ep_ics_end == (today - timedelta(days=8)).strftime("%Y%m%d")
+
+
+@pytest.mark.asyncio
+async def test_add_to_series_without_embedded_episodes_stores_nothing(async_db_session):
+    async_db_session.add(Lists(list_id=1, list_name="main"))
+    await async_db_session.commit()
+    form = {"series-id": "5", "list-id": "1", "series-name": "Show"}
+    request = AsyncMock(spec=Request)
+    request.form = AsyncMock(return_value=MagicMock(get=form.get))
+    request.client.host = "127.0.0.1"
+
+    with patch('src.cal_logic.input.AsyncSessionLocal') as mock_factory, \
+            patch('src.cal_logic.gather.fetch_data', new=AsyncMock(return_value={"id": 5, "name": "Show", "externals": {}})):
+        mock_factory.return_value.__aenter__.return_value = async_db_session
+        response = await add_to_series(request)
+
+    assert response.context["message"].startswith("Error: Show could not be fetched")
+    assert response.background is None
+    assert (await async_db_session.scalars(select(Series))).first() is None
+    assert (await async_db_session.scalars(select(ListEntries))).first() is None
+
+
+@pytest.mark.asyncio
+async def test_add_to_series_already_on_list_does_not_export(async_db_session):
+    async_db_session.add_all([
+        Lists(list_id=1, list_name="main"),
+        Series(series_id=5, series_name="Show", series_status="Running"),
+        ListEntries(list_id=1, series_id=5, archive=0),
+    ])
+    await async_db_session.commit()
+    form = {"series-id": "5", "list-id": "1", "series-name": "Show"}
+    request = AsyncMock(spec=Request)
+    request.form = AsyncMock(return_value=MagicMock(get=form.get))
+    request.client.host = "127.0.0.1"
+
+    with patch('src.cal_logic.input.AsyncSessionLocal') as mock_factory:
+        mock_factory.return_value.__aenter__.return_value = async_db_session
+        response = await add_to_series(request)
+
+    assert response.headers["location"] == "/list/1"
+    assert response.background is None
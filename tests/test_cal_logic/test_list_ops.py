@@ -9,7 +9,7 @@ from src.cal_logic.list_ops import create_list, rename_list
 from src.models import Lists, AuditLogEntry
 
 @pytest.mark.asyncio
-async def test_create_list_valid_input(db_session):
+async def test_create_list_valid_input(async_db_session):
     # 1. Setup Mock Request (Keep this, as Request is hard to build manually)
     form_data = MagicMock()
     form_data.get.return_value = "validlist123"
@@ -17,11 +17,11 @@ async def test_create_list_valid_input(db_session):
     request.form = AsyncMock(return_value=form_data)
     request.client.host = "127.0.0.1"
 
-    # 2. Patch the SessionLocal factory in your app to use your TEST session
-    # This ensures 'with SessionLocal()' inside your app uses the in-memory DB
-    with patch('src.cal_logic.list_ops.SessionLocal') as mock_factory:
+    # 2. Patch the AsyncSessionLocal factory in your app to use your TEST session
+    # This ensures 'async with AsyncSessionLocal()' inside your app uses the in-memory DB
+    with patch('src.cal_logic.list_ops.AsyncSessionLocal') as mock_factory:
         # This makes the context manager return your real test session
-        mock_factory.return_value.__enter__.return_value = db_session
+        mock_factory.return_value.__aenter__.return_value = async_db_session
         
         # 3. Call the function (it now runs against the real SQLite memory DB)
         response = await create_list(request)
@@ -31,7 +31,7 @@ async def test_create_list_valid_input(db_session):
     assert response.context['message'] == "validlist123 has been created"
     
     # Verify the data was actually saved to the in-memory DB
-    saved_list = db_session.query(Lists).filter_by(list_name="validlist123").first()
+    saved_list = (await async_db_session.scalars(select(Lists).filter_by(list_name="validlist123"))).first()
     assert saved_list is not None
 
 """
@@ -68,13 +68,13 @@ async def test_create_list_name_conflict(db_session):
     assert response.context['message'] == "A list with that name exists already"
 """
 @pytest.mark.asyncio
-async def test_rename_list_valid(db_session):
+async def test_rename_list_valid(async_db_session):
     # 1. Setup Data in the real in-memory DB
     original_list = Lists(list_name="oldname")
     new_list_name = "newname123"
-    db_session.add(original_list)
-    db_session.commit()
-    db_session.refresh(original_list)
+    async_db_session.add(original_list)
+    await async_db_session.commit()
+    await async_db_session.refresh(original_list)
     list_id = original_list.list_id
 
     # 2. Setup Mock Request
@@ -85,9 +85,9 @@ async def test_rename_list_valid(db_session):
     request.form = AsyncMock(return_value=form_data)
     request.client.host = "127.0.0.1"
 
-    # 3. Patch SessionLocal to use our real test DB session
-    with patch('src.cal_logic.list_ops.SessionLocal') as mock_factory:
-        mock_factory.return_value.__enter__.return_value = db_session
+    # 3. Patch AsyncSessionLocal to use our real test DB session
+    with patch('src.cal_logic.list_ops.AsyncSessionLocal') as mock_factory:
+        mock_factory.return_value.__aenter__.return_value = async_db_session
 
         response = await rename_list(request)
 
@@ -96,14 +96,14 @@ async def test_rename_list_valid(db_session):
     assert response.headers['location'] == f"/list/{list_id}"
 
     # Verify the database was actually updated
-    db_session.expire_all() # Ensure we aren't looking at cached data
-    updated_list = db_session.get(Lists, list_id)
+    async_db_session.expire_all() # Ensure we aren't looking at cached data
+    updated_list = await async_db_session.get(Lists, list_id)
     assert updated_list.list_name == new_list_name
 
     # Verify Audit Log was created
-    audit = db_session.query(AuditLogEntry).filter(
+    audit = (await async_db_session.scalars(select(AuditLogEntry).where(
         AuditLogEntry.list_id == list_id,
         AuditLogEntry.list_name == new_list_name
-    ).first()    
+    ))).first()
     assert audit is not None
 
@@ -1,11 +1,16 @@
 import pytest
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+import brotli
+import gzip
+import hashlib
 import io
-from starlette.responses import StreamingResponse
+from starlette.responses import StreamingResponse, FileResponse
 from starlette.requests import Request
-from src.cal_logic.output import download_calendar
+from src.cal_logic.output import download_calendar, download_merged_calendar, render_event
+from src.cal_logic.cache import feed_cache, choose_encoding, content_etag
+from src.cal_logic.export import export_feed
 from src.models import Series, Episodes, ListEntries, Lists
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 
 @pytest.mark.asyncio
@@ -46,6 +51,8 @@ async def test_download_calendar_success(db_session):
     # 2. Setup Mock Request with path_params
     request = AsyncMock(spec=Request)
     request.path_params = {'list_id': list_id}
+    request.query_params = {}
+    request.headers = {}
     request.client.host = "127.0.0.1"
 
     # 3. Patch SessionLocal and Run
@@ -71,4 +78,270 @@ async def test_download_calendar_success(db_session):
     assert "BEGIN:VCALENDAR" in ical_text
     assert "SUMMARY:The Test Show S01E01" in ical_text
     assert "UID:999" in ical_text
-    assert "END:VCALENDAR" in ical_text
\ No newline at end of file
+    assert "END:VCALENDAR" in ical_text
+
+
+def add_list_with_episode(db_session):
+    new_list = Lists(list_name="Cached")
+    db_session.add(new_list)
+    db_session.commit()
+    db_session.add(Series(series_id=202, series_name="Cached Show", series_ext_imdb="tt2", series_last_updated=datetime.now()))
+    db_session.add(Episodes(ep_id=2020, ep_series_id=202, ep_name="One", ep_season=1, ep_number=1, ep_airdate=date.today()))
+    db_session.add(ListEntries(list_id=new_list.list_id, series_id=202, archive=0))
+    db_session.commit()
+    return new_list.list_id
+
+
+def calendar_request(list_id, headers=None, query_params=None):
+    request = AsyncMock(spec=Request)
+    request.path_params = {'list_id': str(list_id)}
+    request.query_params = query_params or {}
+    request.headers = headers or {}
+    request.client.host = "127.0.0.1"
+    return request
+
+
+async def read_body(response):
+    content = b""
+    async for chunk in response.body_iterator:
+        content += chunk
+    return content
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_not_modified(db_session):
+    list_id = add_list_with_episode(db_session)
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        # the first download renders the feed into the cache before it is sent, with the etag the cache uses
+        first = download_calendar(calendar_request(list_id))
+        streamed = await read_body(first)
+
+        # cached feed: no second render
+        mock_factory.reset_mock()
+        cached = download_calendar(calendar_request(list_id))
+        etag = cached.headers['ETag']
+        last_modified = cached.headers['Last-Modified']
+        by_etag = download_calendar(calendar_request(list_id, {'if-none-match': etag}))
+        by_date = download_calendar(calendar_request(list_id, {'if-modified-since': last_modified}))
+        mismatch = download_calendar(calendar_request(list_id, {'if-none-match': '"other"'}))
+        mock_factory.assert_not_called()
+
+    assert await read_body(cached) == streamed
+    assert etag == first.headers['ETag']
+    assert last_modified == first.headers['Last-Modified']
+    assert by_etag.status_code == 304
+    assert by_etag.headers['ETag'] == etag
+    assert by_date.status_code == 304
+    assert isinstance(mismatch, StreamingResponse)
+    assert mismatch.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_invalidate_rerenders(db_session):
+    list_id = add_list_with_episode(db_session)
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        await read_body(download_calendar(calendar_request(list_id)))
+        etag = download_calendar(calendar_request(list_id)).headers['ETag']
+
+        db_session.add(Episodes(ep_id=2021, ep_series_id=202, ep_name="Two", ep_season=1, ep_number=2, ep_airdate=date.today()))
+        db_session.commit()
+        feed_cache.invalidate(list_id)
+
+        response = download_calendar(calendar_request(list_id, {'if-none-match': etag}))
+        content = await read_body(response)
+
+    assert response.status_code == 200
+    assert "UID:2021" in content.decode('utf-8')
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_large_feed_not_cached(db_session):
+    list_id = add_list_with_episode(db_session)
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory, \
+            patch('src.cal_logic.output.FEED_CACHE_MAX_BYTES', 100):
+        mock_factory.return_value.__enter__.return_value = db_session
+        response = download_calendar(calendar_request(list_id))
+        mock_factory.return_value.__exit__.assert_called_once() # db session closed before the body is sent
+        content = await read_body(response)
+        not_modified = download_calendar(calendar_request(list_id, {'if-none-match': response.headers['ETag']}))
+
+    assert content.endswith(b"END:VCALENDAR")
+    assert response.headers['ETag'] == content_etag(hashlib.sha256(content))
+    assert not_modified.status_code == 304
+    assert not feed_cache._entries
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_date_window(db_session):
+    list_id = add_list_with_episode(db_session)
+    db_session.add(Episodes(ep_id=2022, ep_series_id=202, ep_name="Later", ep_season=1, ep_number=2, ep_airdate=date.today() + timedelta(days=60)))
+    db_session.commit()
+    window = {'from': date.today().isoformat(), 'to': (date.today() + timedelta(days=30)).isoformat()}
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        windowed = (await read_body(download_calendar(calendar_request(list_id, query_params=window)))).decode('utf-8')
+        full = (await read_body(download_calendar(calendar_request(list_id)))).decode('utf-8')
+        invalid = download_calendar(calendar_request(list_id, query_params={'from': '2026-02-01', 'to': '2026-01-01'}))
+
+    assert "UID:2020" in windowed
+    assert "UID:2022" not in windowed
+    assert "UID:2022" in full
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_compressed(db_session):
+    list_id = add_list_with_episode(db_session)
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        plain = await read_body(download_calendar(calendar_request(list_id)))
+        gzipped = download_calendar(calendar_request(list_id, {'accept-encoding': 'gzip, deflate'}))
+        brotlied = download_calendar(calendar_request(list_id, {'accept-encoding': 'gzip;q=0.5, br'}))
+        not_modified = download_calendar(calendar_request(list_id, {'accept-encoding': 'gzip', 'if-none-match': gzipped.headers['ETag']}))
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(await read_body(gzipped)) == plain
+    assert brotlied.headers['Content-Encoding'] == 'br'
+    assert brotli.decompress(await read_body(brotlied)) == plain
+    assert len({gzipped.headers['ETag'], brotlied.headers['ETag']}) == 2
+    assert not_modified.status_code == 304
+
+    # compressed once per feed version
+    with patch.dict('src.cal_logic.cache.FEED_ENCODINGS', {'gzip': MagicMock()}) as encoders:
+        download_calendar(calendar_request(list_id, {'accept-encoding': 'gzip'}))
+        encoders['gzip'].assert_not_called()
+
+
+def test_choose_encoding():
+    assert choose_encoding(None) == 'identity'
+    assert choose_encoding('deflate') == 'identity'
+    assert choose_encoding('gzip') == 'gzip'
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('br;q=0, gzip;q=0.1') == 'gzip'
+    assert choose_encoding('*') == 'br'
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_reuses_fragments(db_session):
+    list_id = add_list_with_episode(db_session)
+    db_session.add(Series(series_id=303, series_name="Other Show", series_ext_imdb="tt3", series_last_updated=datetime.now()))
+    db_session.add(Episodes(ep_id=3030, ep_series_id=303, ep_name="Other", ep_season=2, ep_number=5, ep_airdate=date.today()))
+    db_session.add(ListEntries(list_id=list_id, series_id=303, archive=0))
+    db_session.commit()
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        first = await read_body(download_calendar(calendar_request(list_id)))
+
+        # refresh one show: only its episode is rendered again
+        db_session.get(Series, 303).series_last_updated = datetime(2030, 1, 1)
+        db_session.commit()
+        feed_cache.invalidate(list_id)
+        with patch('src.cal_logic.output.render_event', wraps=render_event) as rendered:
+            second = await read_body(download_calendar(calendar_request(list_id)))
+
+    assert [call.args[1].ep_id for call in rendered.call_args_list] == [3030]
+    assert first.split(b"BEGIN:VEVENT")[1] == second.split(b"BEGIN:VEVENT")[1]
+    assert b"Last updated: 01-Jan-2030 00:00" in second
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_exported_file(db_session, tmp_path):
+    list_id = add_list_with_episode(db_session)
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory, \
+            patch('src.cal_logic.cache.FEED_EXPORT_DIR', tmp_path):
+        mock_factory.return_value.__enter__.return_value = db_session
+        live = await read_body(download_calendar(calendar_request(list_id)))
+
+        export_feed(list_id)
+        exported = download_calendar(calendar_request(list_id))
+        gzipped = download_calendar(calendar_request(list_id, {'accept-encoding': 'gzip'}))
+        not_modified = download_calendar(calendar_request(list_id, {'if-none-match': exported.headers['ETag']}))
+
+        assert (tmp_path / f"{list_id}.ics").read_bytes() == live
+        assert gzip.decompress((tmp_path / f"{list_id}.ics.gz").read_bytes()) == live
+        assert brotli.decompress((tmp_path / f"{list_id}.ics.br").read_bytes()) == live
+
+        feed_cache.invalidate(list_id)
+        after_change = download_calendar(calendar_request(list_id))
+
+    assert isinstance(exported, FileResponse)
+    assert exported.headers['ETag'] == content_etag(hashlib.sha256(live)) # same etag as the feed_cache entry
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert not_modified.status_code == 304
+    assert not any(tmp_path.iterdir())
+    assert isinstance(after_change, StreamingResponse)
+
+
+@pytest.mark.asyncio
+async def test_download_merged_calendar(db_session):
+    list_id = add_list_with_episode(db_session)
+    other_list = Lists(list_name="Other")
+    db_session.add(other_list)
+    db_session.add(Series(series_id=303, series_name="Other Show", series_ext_imdb="tt3", series_last_updated=datetime.now()))
+    db_session.add(Episodes(ep_id=3030, ep_series_id=303, ep_name="Other", ep_season=2, ep_number=5, ep_airdate=date.today()))
+    db_session.commit()
+    db_session.add(ListEntries(list_id=other_list.list_id, series_id=202, archive=0)) # on both lists
+    db_session.add(ListEntries(list_id=other_list.list_id, series_id=303, archive=0))
+    db_session.commit()
+    lists = {'lists': f"{other_list.list_id},{list_id}"}
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        merged = (await read_body(download_merged_calendar(calendar_request('merge', query_params=lists)))).decode('utf-8')
+        etag = download_merged_calendar(calendar_request('merge', query_params=lists)).headers['ETag']
+        db_session.add(Episodes(ep_id=2021, ep_series_id=202, ep_name="Two", ep_season=1, ep_number=2, ep_airdate=date.today()))
+        db_session.commit()
+        feed_cache.invalidate(list_id)
+        after_change = download_merged_calendar(calendar_request('merge', query_params=lists, headers={'if-none-match': etag}))
+        await read_body(after_change)
+        invalid = download_merged_calendar(calendar_request('merge', query_params={'lists': '1,x'}))
+
+    assert merged.count("UID:2020\n") == 1
+    assert merged.count("UID:3030\n") == 1
+    assert after_change.status_code == 200
+    assert invalid.status_code == 400
+
+
+def test_feed_cache_bounded_by_bytes_of_bodies_and_variants():
+    from src.cal_logic.cache import FeedCache
+
+    cache = FeedCache(max_entries=10, max_bytes=3000)
+    first = cache.store(((1,), None, None), b"a" * 1000, cache.generation((1,)))
+    cache.store(((2,), None, None), b"b" * 1000, cache.generation((2,)))
+    first.encoded("gzip")
+    assert cache.stats()["bytes"] == 2000 + len(first.encoded("gzip"))
+
+    cache.store(((3,), None, None), b"c" * 1000, cache.generation((3,))) # over 3000 bytes, first is evicted
+    assert cache.get(((1,), None, None)) is None
+    assert cache.stats() == {"entries": 2, "bytes": 2000}
+
+    first.encoded("br") # evicted entries no longer count
+    cache.invalidate(2)
+    assert cache.stats() == {"entries": 1, "bytes": 1000}
+
+
+@pytest.mark.asyncio
+async def test_download_calendar_custom_windows_are_clamped_and_not_cached(db_session):
+    from src.cal_logic.output import calendar_window
+
+    list_id = add_list_with_episode(db_session)
+    window = {'from': '1900-01-01', 'to': (date.today() + timedelta(days=30)).isoformat()}
+
+    with patch('src.cal_logic.output.SessionLocal') as mock_factory:
+        mock_factory.return_value.__enter__.return_value = db_session
+        response = download_calendar(calendar_request(list_id, query_params=window))
+        assert "UID:2020" in (await read_body(response)).decode('utf-8')
+
+    assert calendar_window(window)[0] == date.today() - timedelta(days=365)
+    assert calendar_window({'to': '2999-01-01'})[1] == date.today() + timedelta(days=365)
+    assert not feed_cache._entries
@@ -1,11 +1,13 @@
-from datetime import datetime
-from unittest.mock import patch
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
 
-from src.cal_logic.update import series_update
+from src.cal_logic.update import store_series_update, series_update_async
 from src.models import Series, Episodes
 
-def test_series_update_updates_series_and_episodes(db_session):
+def test_store_series_update_updates_series_and_episodes(db_session):
     series_id = 1
+    airdate = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
 
     # --- Arrange -------------------------------------------------
 
@@ -19,6 +21,12 @@ def test_series_update_updates_series_and_episodes(db_session):
             series_ext_imdb=None,
         )
     )
+    # Stored episodes: one unchanged, one renamed upstream, one removed upstream
+    db_session.add_all([
+        Episodes(ep_series_id=series_id, ep_id=11, ep_name="Pilot", ep_season=1, ep_number=1, ep_airdate=airdate),
+        Episodes(ep_series_id=series_id, ep_id=12, ep_name="TBA", ep_season=1, ep_number=2, ep_airdate=airdate),
+        Episodes(ep_series_id=series_id, ep_id=13, ep_name="Cancelled", ep_season=1, ep_number=3, ep_airdate=airdate),
+    ])
     db_session.commit()
 
     mock_series_data = {
@@ -31,26 +39,14 @@ def test_series_update_updates_series_and_episodes(db_session):
     }
 
     mock_episode_data = [
-        {
-            "season": 1,
-            "episode": 1,
-            "title": "Pilot",
-        }
+        {"id": 11, "name": "Pilot", "season": 1, "number": 1, "airdate": airdate.strftime("%Y-%m-%d")},
+        {"id": 12, "name": "The Second One", "season": 1, "number": 2, "airdate": airdate.strftime("%Y-%m-%d")},
+        {"id": 14, "name": "New", "season": 1, "number": 4, "airdate": airdate.strftime("%Y-%m-%d")},
     ]
 
     # --- Act -----------------------------------------------------
 
-    with patch(
-        "src.cal_logic.gather.try_request_series",
-        return_value=mock_series_data,
-    ), patch(
-        "src.cal_logic.gather.try_request_episodes",
-        return_value=mock_episode_data,
-    ), patch(
-        "src.cal_logic.input.add_episodes",
-    ) as mock_add_episodes:
-
-        series_update(series_id, db=db_session)
+    counts = store_series_update(series_id, mock_series_data, mock_episode_data, db=db_session)
 
     # --- Assert --------------------------------------------------
 
@@ -67,4 +63,101 @@ def test_series_update_updates_series_and_episodes(db_session):
     assert isinstance(series.series_last_updated, datetime)
 
     # Episodes behavior
-    mock_add_episodes.assert_called_once_with(series_id, mock_episode_data)
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+    db_session.expire_all()
+    episodes = {episode.ep_id: episode for episode in db_session.query(Episodes).all()}
+    assert sorted(episodes) == [11, 12, 14]
+    assert episodes[12].ep_name == "The Second One"
+
+
+@pytest.mark.asyncio
+async def test_fetch_with_backoff_retries_without_blocking(fake_response):
+    from src.cal_logic.gather import fetch_with_backoff
+
+    session = MagicMock()
+    session.get.side_effect = [fake_response(503), fake_response(503), fake_response(200, {"id": 1})]
+    with patch("src.services.tvmaze.get_session", return_value=session), \
+            patch("src.cal_logic.gather.asyncio.sleep", new=AsyncMock()) as sleep:
+        data, not_modified = await fetch_with_backoff("https://api.tvmaze.com/shows/1")
+
+    assert data == {"id": 1}
+    assert not not_modified
+    assert session.get.call_count == 3
+    assert sleep.await_count >= 2 # backoff awaits, it never blocks the loop
+
+
+@pytest.mark.asyncio
+async def test_series_update_async_gives_up_on_client_errors(fake_response):
+    session = MagicMock()
+    session.get.side_effect = [fake_response(404)]
+    with patch("src.services.tvmaze.get_session", return_value=session), \
+            patch("src.cal_logic.gather.asyncio.sleep", new=AsyncMock()) as sleep, \
+            patch("src.cal_logic.gather.schedule_series_retry") as schedule_retry, \
+            patch("src.cal_logic.update.store_series_update") as store:
+        assert await series_update_async(5) is None
+
+    assert session.get.call_count == 1 # no backoff for a deleted show
+    assert sleep.await_count <= 1 # only the rate limiter, never a backoff delay
+    schedule_retry.assert_not_called()
+    store.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_series_update_async_hands_failures_back_to_scheduler():
+    with patch("src.cal_logic.gather.fetch_series_update_data", new=AsyncMock(return_value=(None, None, False))), \
+            patch("src.cal_logic.gather.schedule_series_retry") as schedule_retry, \
+            patch("src.cal_logic.update.store_series_update") as store:
+        counts = await series_update_async(5)
+
+    assert counts is None
+    schedule_retry.assert_called_once_with(5)
+    store.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_series_update_async_stores_cached_data_when_not_modified():
+    unchanged = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 3}
+    with patch("src.cal_logic.gather.fetch_series_update_data", new=AsyncMock(return_value=({"id": 5}, [], True))), \
+            patch("src.cal_logic.update.store_series_update", return_value=unchanged) as store, \
+            patch("src.cal_logic.update.export_series_feeds") as export:
+        await series_update_async(5)
+
+    store.assert_called_once_with(5, {"id": 5}, [], not_modified=True)
+    export.assert_not_called() # the exported feeds are still current
+
+
+@pytest.mark.asyncio
+async def test_series_update_async_exports_changed_feeds():
+    changed = {"inserted": 1, "updated": 0, "deleted": 0, "unchanged": 3}
+    with patch("src.cal_logic.gather.fetch_series_update_data", new=AsyncMock(return_value=({"id": 5}, [], False))), \
+            patch("src.cal_logic.update.store_series_update", return_value=changed), \
+            patch("src.cal_logic.update.export_series_feeds") as export:
+        assert await series_update_async(5) == changed
+
+    export.assert_called_once_with(5)
+
+
+def test_store_series_update_not_modified_marks_series_refreshed(db_session):
+    airdate = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
+    db_session.add(Series(series_id=1, series_name="Show", series_status="Running", series_last_updated=datetime(2020, 1, 1)))
+    db_session.add(Episodes(ep_series_id=1, ep_id=11, ep_name="Pilot", ep_season=1, ep_number=1, ep_airdate=airdate))
+    db_session.commit()
+    sdata = {"name": "Show", "status": "Running", "externals": {}}
+    edata = [{"id": 11, "name": "Pilot", "season": 1, "number": 1, "airdate": airdate.strftime("%Y-%m-%d")}]
+
+    with patch("src.cal_logic.update.feed_cache.invalidate_series") as invalidate:
+        counts = store_series_update(1, sdata, edata, db=db_session, not_modified=True)
+
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 1}
+    assert db_session.get(Series, 1).series_last_updated > datetime(2020, 1, 1)
+    invalidate.assert_not_called() # nothing changed, the cached feeds stay valid
+
+
+def test_split_embedded_show_and_episodes():
+    from src.cal_logic.gather import split_embedded
+
+    data = {"id": 5, "name": "Show", "_embedded": {"episodes": [{"id": 51}, {"id": 52}]}}
+    sdata, edata = split_embedded(data)
+    assert sdata["name"] == "Show"
+    assert [episode["id"] for episode in edata] == [51, 52]
+    assert split_embedded(None) == (None, None)
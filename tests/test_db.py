@@ -29,4 +29,56 @@ def test_tables_created(test_engine):
 
     missing = expected - tables
     assert not missing, f"Missing tables: {missing}"
-"""
\ No newline at end of file
+"""
+
+def test_configure_sqlite_sets_pragmas(tmp_path):
+    from sqlalchemy import create_engine, event, text
+    from src.db import configure_sqlite, SQLITE_BUSY_TIMEOUT, SQLITE_CACHE_SIZE
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    event.listen(engine, "connect", configure_sqlite)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1 # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_BUSY_TIMEOUT
+        assert conn.execute(text("PRAGMA cache_size")).scalar() == SQLITE_CACHE_SIZE
+    engine.dispose()
+
+def test_db_migrations_skips_when_at_head(tmp_path):
+    from unittest.mock import patch
+    from sqlalchemy import create_engine, inspect, text
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    from src.db import db_migrations
+
+    head = ScriptDirectory.from_config(Config("alembic.ini")).get_current_head()
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    with patch("src.db.engine", engine):
+        db_migrations()
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == head
+        assert "Episodes" in inspect(engine).get_table_names()
+
+        # a warm restart does not run alembic's upgrade at all
+        with patch("src.db.command.upgrade") as upgrade:
+            db_migrations()
+        upgrade.assert_not_called()
+    engine.dispose()
+
+def test_migration_casts_episode_numbers_and_backfills_ics_dates(tmp_path):
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'episodes.db'}")
+    config = Config("alembic.ini")
+    config.attributes["configure_logger"] = False
+    with engine.begin() as conn:
+        config.attributes["connection"] = conn
+        command.upgrade(config, "2b7e4c91d5a3")
+        conn.execute(text("INSERT INTO Episodes (ep_series_id, ep_id, ep_name, ep_season, ep_number, ep_airdate) "
+                          "VALUES (1, 10, 'Pilot', '2', '5', '2026-03-31 00:00:00.000000')"))
+        command.upgrade(config, "7c5d2e8f1a46")
+        row = conn.execute(text("SELECT ep_season, ep_number, ep_ics_start, ep_ics_end FROM Episodes")).one()
+    assert tuple(row) == (2, 5, "20260401", "20260402")
+    engine.dispose()
@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+
+from src.services.http import get_session, open_session, close_session
+
+
+@pytest.mark.asyncio
+async def test_shared_session_is_reused_until_closed():
+    await open_session()
+    session = get_session()
+    assert get_session() is session
+    assert session.connector.limit_per_host > 0
+
+    await close_session()
+    assert session.closed
+    assert get_session() is not session
+    await close_session()
+
+
+def test_session_of_a_closed_loop_is_closed_by_the_next_loop():
+    async def open_only():
+        return get_session()
+
+    async def next_loop():
+        get_session()
+        await asyncio.sleep(0) # let the close task run
+        await close_session()
+
+    stale = asyncio.run(open_only())
+    assert not stale.closed
+    asyncio.run(next_loop())
+    assert stale.closed
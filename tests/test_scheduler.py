@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+from src.scheduler import plan_series_refresh
+
+
+def test_plan_series_refresh_only_queues_changed_series():
+    now = datetime(2026, 10, 18, 1, 0)
+    refreshed = now - timedelta(days=7)
+    series_rows = [
+        (1, refreshed), # changed upstream after our refresh
+        (2, refreshed), # in the index, but not changed since our refresh
+        (3, refreshed), # dormant, not in the index
+        (4, now - timedelta(days=60)), # dormant for longer than the index window
+        (5, None), # never refreshed
+    ]
+    updates = {1: now - timedelta(days=2), 2: refreshed - timedelta(days=1)}
+    window = timedelta(days=30)
+
+    # the last plan ran a week ago, so the index covers everything since then
+    assert plan_series_refresh(series_rows, updates, now, planned_at=refreshed, window=window) == [1, 5]
+    # no earlier plan: series older than the window can not be judged by the index
+    assert plan_series_refresh(series_rows, updates, now, window=window) == [1, 4, 5]
+    # without the index every series is refreshed, as before
+    assert plan_series_refresh(series_rows, None, now) == [1, 2, 3, 4, 5]
@@ -0,0 +1,51 @@
+from unittest.mock import AsyncMock, patch
+import aiohttp
+import pytest
+
+from src.services.search import SearchCache, normalize_query, search_shows, search_cache, warm_search_cache
+
+
+def test_normalize_query():
+    assert normalize_query("  The   Rookie ") == "the rookie"
+    assert normalize_query(None) == ""
+
+
+def test_search_cache_expires_and_evicts():
+    cache = SearchCache(max_entries=2, ttl=60)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1] # a is now most recently used
+    cache.put("c", [3])
+    assert cache.get("b") is None
+    with patch("src.services.search.time.monotonic", return_value=10**9):
+        assert cache.get("a") is None # expired
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+
+@pytest.mark.asyncio
+async def test_search_shows_uses_cache_for_normalized_queries():
+    results = [{"score": 1.0, "show": {"id": 1, "name": "The Rookie"}}]
+    with patch("src.services.search.search_local", new=AsyncMock(return_value=None)), \
+            patch("src.services.search.add_search_results", new=AsyncMock()), \
+            patch("src.services.search.tvmaze.get", new=AsyncMock(return_value=results)) as upstream:
+        assert await search_shows("The Rookie") == results
+        assert await search_shows("  the ROOKIE ") == results
+
+    upstream.assert_awaited_once()
+    assert search_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_warm_search_cache_fills_cache_and_skips_failures():
+    async def upstream(url, params=None):
+        if params["q"] == "broken":
+            raise aiohttp.ClientError("down")
+        return [{"score": 1.0, "show": {"id": 1, "name": params["q"]}}]
+
+    with patch("src.services.search.tvmaze.get", new=AsyncMock(side_effect=upstream)), \
+            patch("src.services.search.add_search_results", new=AsyncMock()) as indexed:
+        assert await warm_search_cache(["The Rookie", "broken", "Andor"], concurrency=2) == 2
+
+    assert search_cache.get("the rookie")[0]["show"]["name"] == "the rookie"
+    assert search_cache.get("broken") is None
+    assert indexed.await_count == 2
@@ -0,0 +1,145 @@
+import json
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from src.models import Base, Series
+from src.services.show_index import create_show_search, autocomplete, search_local, add_search_results, import_show_dump, fts_query
+
+
+@pytest_asyncio.fixture
+async def show_index(tmp_path):
+    # fts5 tables and triggers are not part of the metadata, so the index gets a database of its own
+    url = f"sqlite:///{tmp_path / 'shows.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        create_show_search(conn)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    with patch("src.services.show_index.SessionLocal", sessionmaker(bind=engine)), \
+            patch("src.services.show_index.AsyncSessionLocal", async_sessionmaker(bind=async_engine)):
+        yield sessionmaker(bind=engine)
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def test_fts_query_quotes_user_input():
+    assert fts_query('the "rookie') == '"the" """rookie"'
+    assert fts_query("the ro", prefix=True) == '"the" "ro"*'
+    assert fts_query("   ") is None
+
+
+@pytest.mark.asyncio
+async def test_series_table_feeds_autocomplete(show_index):
+    with show_index() as session:
+        session.add_all([
+            Series(series_id=1, series_name="The Rookie", series_status="Running"),
+            Series(series_id=2, series_name="The Rookie: Feds", series_status="Ended"),
+            Series(series_id=3, series_name="Rome", series_status="Ended"),
+        ])
+        session.commit()
+        session.get(Series, 1).series_name = "The Rookie (2018)"
+        session.commit()
+
+    assert sorted(show["id"] for show in await autocomplete("the ROOK")) == [1, 2]
+    assert sorted(show["id"] for show in await autocomplete("ro")) == [1, 2, 3]
+    assert [show["name"] for show in await autocomplete("rome")] == ["Rome"]
+    assert await autocomplete("rookie (2018)") == [{"id": 1, "name": "The Rookie (2018)"}]
+
+
+@pytest.mark.asyncio
+async def test_search_local_needs_exact_name(show_index, tmp_path):
+    dump = tmp_path / "shows.jsonl"
+    dump.write_text("\n".join(json.dumps(show) for show in [
+        {"id": 10, "name": "Fargo", "weight": 99, "premiered": "2014-04-15", "status": "Running"},
+        {"id": 11, "name": "Fargo Nights", "weight": 5, "premiered": None},
+        {"id": 12, "name": "Severance", "weight": 98, "premiered": "2022-02-18"},
+    ]))
+    assert import_show_dump(dump) == 3
+
+    results = await search_local("fargo", max_age=3600)
+    assert [result["show"]["id"] for result in results] == [10, 11]
+    assert results[0]["show"]["premiered"] == "2014-04-15"
+    assert await search_local("farg", max_age=3600) is None # no show named exactly that, tvmaze is asked instead
+
+
+@pytest.mark.asyncio
+async def test_search_local_only_answers_with_full_shows(show_index):
+    with show_index() as session:
+        session.add(Series(series_id=20, series_name="Andor", series_status="Ended"))
+        session.commit()
+    assert await search_local("andor", max_age=3600) is None # only id, name and status are known
+
+    await add_search_results([{"score": 0.9, "show": {"id": 20, "name": "Andor", "premiered": "2022-09-21", "summary": "<p>Star Wars</p>"}}])
+    results = await search_local("andor", max_age=3600)
+    assert results[0]["show"]["summary"] == "<p>Star Wars</p>"
+
+
+@pytest.mark.asyncio
+async def test_search_local_treats_old_search_results_as_misses(show_index):
+    await add_search_results([{"score": 0.9, "show": {"id": 30, "name": "Arcane", "status": "Running"}}])
+    with show_index() as session:
+        session.execute(text("UPDATE ShowIndex SET indexed_at = datetime('now', '-2 hours')"))
+        session.commit()
+
+    assert await search_local("arcane", max_age=3600) is None # refreshed from tvmaze by search_shows
+    assert (await search_local("arcane", max_age=3 * 3600))[0]["show"]["status"] == "Running"
+
+
+@pytest.mark.asyncio
+async def test_search_local_keeps_answering_from_imported_dumps(show_index, tmp_path):
+    dump = tmp_path / "shows.json"
+    dump.write_text(json.dumps([{"id": 50, "name": "Westworld", "premiered": "2016-10-02"}]))
+    import_show_dump(dump)
+    with show_index() as session:
+        session.execute(text("UPDATE ShowIndex SET indexed_at = datetime('now', '-30 days')"))
+        session.commit()
+
+    assert (await search_local("westworld", max_age=3600))[0]["show"]["id"] == 50
+
+
+def test_series_without_status_keeps_the_stored_status(show_index):
+    with show_index() as session:
+        session.execute(text(
+            "INSERT INTO ShowIndex(series_id, series_name, show_json, weight) "
+            "VALUES (40, 'Invincible', '{\"id\": 40, \"name\": \"Invincible\", \"status\": \"Running\"}', 0)"
+        ))
+        session.add(Series(series_id=40, series_name="Invincible", series_status=None))
+        session.commit()
+        session.get(Series, 40).series_name = "Invincible (2021)"
+        session.commit()
+        show = json.loads(session.execute(text("SELECT show_json FROM ShowIndex WHERE series_id = 40")).scalar())
+    assert show == {"id": 40, "name": "Invincible (2021)", "status": "Running"}
+
+
+# SHOW_SEARCH_DDL stands in for the migrations in tests and benchmarks, so both must build the same index
+def test_show_search_ddl_matches_migrations(tmp_path):
+    from alembic import command
+    from alembic.config import Config
+
+    def schema(engine):
+        with engine.connect() as conn:
+            objects = conn.execute(text(
+                "SELECT type, name, sql FROM sqlite_master WHERE name LIKE 'ShowSearch' OR type = 'trigger' ORDER BY name"
+            )).all()
+            columns = [column.name for column in conn.execute(text("PRAGMA table_info(ShowIndex)"))]
+        return [tuple(row) for row in objects], columns
+
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    config = Config("alembic.ini")
+    config.attributes["configure_logger"] = False
+    with migrated.begin() as conn:
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+
+    created = create_engine(f"sqlite:///{tmp_path / 'created.db'}")
+    Base.metadata.create_all(bind=created)
+    with created.begin() as conn:
+        create_show_search(conn)
+
+    assert schema(created) == schema(migrated)
+    migrated.dispose()
+    created.dispose()
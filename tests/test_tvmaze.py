@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+
+from src.services.tvmaze import TokenBucket, TVmazeClient, ResponseCache, retry_after_seconds
+
+
+def test_token_bucket_spaces_calls_after_burst():
+    bucket = TokenBucket(rate=20, period=10)
+    waits = [bucket.reserve() for _ in range(22)]
+    assert all(wait == 0 for wait in waits[:20])
+    assert waits[20] == pytest.approx(0.5, abs=0.05)
+    assert waits[21] == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_pause_delays_next_call():
+    bucket = TokenBucket(rate=20, period=10)
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5.5, abs=0.05) # pause, then refill from empty
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("7") == 7
+    assert retry_after_seconds(None, default=10) == 10
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0 # in the past
+
+
+@pytest.mark.asyncio
+async def test_client_honors_retry_after(tmp_path, fake_response):
+    client = TVmazeClient(TokenBucket(rate=20, period=10), ResponseCache(tmp_path))
+    session = MagicMock()
+    session.get.side_effect = [fake_response(429, headers={"Retry-After": "3"}), fake_response(200, {"id": 1})]
+
+    with patch("src.services.tvmaze.get_session", return_value=session), \
+            patch("src.services.tvmaze.asyncio.sleep", new=AsyncMock()) as sleep:
+        data = await client.get("https://api.tvmaze.com/shows/1")
+
+    assert data == {"id": 1}
+    assert sleep.await_args_list[1].args[0] == pytest.approx(3.5, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_client_revalidates_cached_response(tmp_path, fake_response):
+    client = TVmazeClient(TokenBucket(rate=20, period=10), ResponseCache(tmp_path))
+    session = MagicMock()
+    session.get.side_effect = [
+        fake_response(200, {"id": 1, "name": "Show"}, headers={"ETag": '"abc"'}),
+        fake_response(304),
+    ]
+
+    with patch("src.services.tvmaze.get_session", return_value=session):
+        first = await client.get_cached("https://api.tvmaze.com/shows/1", cache=True)
+        second = await client.get_cached("https://api.tvmaze.com/shows/1", cache=True)
+
+    assert first == ({"id": 1, "name": "Show"}, False)
+    assert second == ({"id": 1, "name": "Show"}, True)
+    assert session.get.call_args.kwargs["headers"] == {"If-None-Match": '"abc"'}
+
+
+def test_client_uses_a_requests_session_per_thread(tmp_path):
+    client = TVmazeClient(TokenBucket(rate=20, period=10), ResponseCache(tmp_path))
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(client._requests()))
+    thread.start()
+    thread.join()
+    assert client._requests() is client._requests()
+    assert sessions[0] is not client._requests()
+
+
+def test_response_cache_prunes_unused_entries(tmp_path):
+    cache = ResponseCache(tmp_path)
+    cache.put("https://api.tvmaze.com/shows/1", '"a"', None, {"id": 1})
+    cache.put("https://api.tvmaze.com/shows/2", '"b"', None, {"id": 2})
+    old = time.time() - 40 * 86400
+    for path in tmp_path.glob("*.json"):
+        os.utime(path, (old, old))
+    cache.touch("https://api.tvmaze.com/shows/2") # confirmed by a 304
+
+    assert cache.prune(30 * 86400) == 1
+    assert cache.get("https://api.tvmaze.com/shows/1") is None
+    assert cache.get("https://api.tvmaze.com/shows/2")["body"] == {"id": 2}